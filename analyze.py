@@ -0,0 +1,166 @@
+import os
+import csv
+import logging
+import argparse
+import multiprocessing
+from collections import Counter
+from urllib.parse import urlsplit, urljoin
+
+from output_readers import iter_raw_chunks, decode_chunk
+
+try:
+    from publicsuffix2 import get_sld
+except ImportError:
+    get_sld = None
+
+
+SUMMARY_FILENAME = "site_summary.csv"
+
+SUMMARY_HEADERS = ["website_id", "website_url", "requests", "bytes", "third_party_domain_count",
+                   "third_party_domains", "status_codes", "redirect_chain", "final_url"]
+
+REDIRECT_STATUS_CODES = (301, 302, 303, 307, 308)
+
+
+def registrable_domain(host):
+    """
+    eTLD+1 of a host (public suffix list if publicsuffix2 is available, else the last two labels).
+    """
+    host = (host or "").lower().split(":")[0]
+    if not host:
+        return ""
+    if get_sld is not None:
+        return get_sld(host) or host
+    return ".".join(host.split(".")[-2:])
+
+
+def response_size(record):
+    """
+    Response size in bytes: stored body size, inline body length or Content-Length header.
+    """
+    if record.get("response_body_size") is not None:
+        return record["response_body_size"]
+    if record.get("response_body"):
+        return len(record["response_body"].encode('utf-8'))
+    headers = record.get("response_headers") or {}
+    for key, value in headers.items():
+        if key.lower() == "content-length":
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return 0
+    return 0
+
+
+def new_aggregate(website_url):
+    return {"website_url": website_url, "requests": 0, "bytes": 0, "third_party_domains": set(),
+            "status_codes": Counter(), "redirects": {}}
+
+
+def aggregate_chunk(chunk):
+    """
+    Worker: per-website partial aggregates of one raw output chunk.
+    """
+    aggregates = {}
+    for record in decode_chunk(chunk):
+        website_id = record.get("website_id")
+        site = aggregates.get(website_id)
+        if site is None:
+            site = aggregates[website_id] = new_aggregate(record.get("website_url"))
+
+        site["requests"] += 1
+        site["bytes"] += response_size(record)
+        status_code = record.get("status_code")
+        site["status_codes"][status_code if status_code is not None else "none"] += 1
+
+        url = record.get("url") or ""
+        site_domain = registrable_domain(urlsplit(site["website_url"] or "").hostname)
+        request_domain = registrable_domain(urlsplit(url).hostname)
+        if request_domain and request_domain != site_domain:
+            site["third_party_domains"].add(request_domain)
+
+        if status_code in REDIRECT_STATUS_CODES and record.get("location_header"):
+            site["redirects"].setdefault(url, urljoin(url, record["location_header"]))
+    return aggregates
+
+
+def merge_aggregate(target, source):
+    target["requests"] += source["requests"]
+    target["bytes"] += source["bytes"]
+    target["third_party_domains"] |= source["third_party_domains"]
+    target["status_codes"].update(source["status_codes"])
+    for url, location in source["redirects"].items():
+        target["redirects"].setdefault(url, location)
+
+
+def redirect_chain(website_url, redirects, max_hops=20):
+    """
+    Follow the redirects of the landing page, starting at the crawled URL.
+    """
+    chain = [website_url]
+    url = website_url
+    for _ in range(max_hops):
+        # The crawled URL is requested with a trailing slash by the browser
+        location = redirects.get(url) or redirects.get(url + "/")
+        if not location or location in chain:
+            break
+        chain.append(location)
+        url = location
+    return chain
+
+
+def summary_row(website_id, site):
+    chain = redirect_chain(site["website_url"], site["redirects"])
+    return [
+        website_id,
+        site["website_url"],
+        site["requests"],
+        site["bytes"],
+        len(site["third_party_domains"]),
+        ";".join(sorted(site["third_party_domains"])),
+        ";".join(f"{code}:{count}" for code, count in sorted(site["status_codes"].items(), key=lambda item: str(item[0]))),
+        " -> ".join(chain) if len(chain) > 1 else "",
+        chain[-1],
+    ]
+
+
+def analyze_run(run_dir, workers=None, output_format=None):
+    """
+    Stream a run's output through a process pool and write one summary row per website
+    to site_summary.csv in the run directory. Returns the number of websites summarized.
+
+    Websites are written as soon as a chunk no longer contains them (the outputs keep the
+    requests of a website together), so memory stays bounded by two chunks of aggregates.
+    """
+    summary_path = os.path.join(run_dir, SUMMARY_FILENAME)
+    open_sites = {}
+    written = 0
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool, open(summary_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_HEADERS)
+        for aggregates in pool.imap(aggregate_chunk, iter_raw_chunks(run_dir, output_format)):
+            for website_id in list(open_sites):
+                if website_id not in aggregates:
+                    writer.writerow(summary_row(website_id, open_sites.pop(website_id)))
+                    written += 1
+            for website_id, site in aggregates.items():
+                if website_id in open_sites:
+                    merge_aggregate(open_sites[website_id], site)
+                else:
+                    open_sites[website_id] = site
+        for website_id, site in open_sites.items():
+            writer.writerow(summary_row(website_id, site))
+            written += 1
+    logging.info(f"Summary of {written} websites written to {summary_path}")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the captured requests of a finished measurement run per website")
+    parser.add_argument("run_dir", type=str, help="Measurement directory, e.g. measurements/2025-01-01_10-00-00")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. (default: all cores)")
+    parser.add_argument("--output-format", choices=["csv", "jsonl", "parquet"], default=None, help="Output format of the run. (default: detected)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    analyze_run(args.run_dir, workers=args.workers, output_format=args.output_format)
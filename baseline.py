@@ -0,0 +1,158 @@
+import os
+import logging
+from collections import deque
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from progress_journal import ProgressJournal, JOURNAL_FILENAME
+
+
+PROBE_TIMEOUT = 10
+MAX_REDIRECTS = 10
+PROBE_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"
+
+# Statuses of a baseline website whose output can be carried over
+COMPLETED_STATUSES = ("done", "unchanged")
+
+
+def probe_fingerprint(domain, timeout=PROBE_TIMEOUT):
+    """
+    Cheap fingerprint of a website's landing page, fetched without a browser:
+    {"final_url" (after redirects), "etag", "last_modified", "source"} of the root document, or None
+    if unreachable. Only the response headers are read. The root document is requested unencoded,
+    as servers derive a different ETag for every content encoding.
+    """
+    try:
+        with requests.get(f"https://{domain}/", timeout=timeout, stream=True, allow_redirects=True,
+                          headers={"User-Agent": PROBE_USER_AGENT, "Accept-Encoding": "identity"}) as response:
+            return {
+                "final_url": response.url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "source": "probe",
+            }
+    except requests.RequestException as e:
+        logging.debug(f"Fingerprint probe of {domain} failed: {e}")
+        return None
+
+
+def landing_fingerprint(website_url, records):
+    """
+    The probe_fingerprint of a website, taken from the request records of its browser visit:
+    follows the HTTP redirects from website_url to the root document. None if the root
+    document was not captured.
+    """
+    def normalized(url):
+        return url if urlsplit(url).path else url + "/"
+
+    responses = {}
+    for record in records:
+        if record.get("status_code") is not None:
+            responses.setdefault(normalized(record["url"]), record)
+    url = normalized(website_url)
+    for _ in range(MAX_REDIRECTS + 1):
+        record = responses.get(url)
+        if record is None:
+            return None
+        if 300 <= record["status_code"] < 400 and record.get("location_header"):
+            url = normalized(urljoin(url, record["location_header"]))
+            continue
+        headers = {key.lower(): value for key, value in (record.get("response_headers") or {}).items()}
+        return {"final_url": url, "etag": headers.get("etag"), "last_modified": headers.get("last-modified"), "source": "browser"}
+    return None
+
+
+def fingerprint_changed(previous, current):
+    """
+    Whether a website needs a browser again. Unknown fingerprints count as changed. Without
+    ETag and Last-Modified on either side, only the landing page redirect target is compared.
+    ETags are only compared between fingerprints of the same source (probe or browser visit),
+    the browser negotiates a compressed encoding and gets a different ETag. Across sources a
+    website with an ETag is unchanged only if both sides have the same Last-Modified.
+    """
+    if not previous or not current:
+        return True
+    keys = ("final_url", "etag", "last_modified")
+    if previous.get("source") != current.get("source"):
+        if (previous.get("etag") or current.get("etag")) and not (previous.get("last_modified") and current.get("last_modified")):
+            return True
+        keys = ("final_url", "last_modified")
+    return any(previous.get(key) != current.get(key) for key in keys)
+
+
+def probe_sites(sites, workers=16, timeout=PROBE_TIMEOUT):
+    """
+    Yield (site, fingerprint) in input order for site tuples (website_id, domain, ...),
+    probing up to `workers` websites concurrently.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fingerprint-probe") as executor:
+        pending = deque()
+        for site in sites:
+            pending.append((site, executor.submit(probe_fingerprint, site[1], timeout)))
+            if len(pending) >= workers * 2:
+                site, future = pending.popleft()
+                yield site, future.result()
+        while pending:
+            site, future = pending.popleft()
+            yield site, future.result()
+
+
+class IncrementalPlan:
+    """
+    Websites of an incremental re-crawl against a previous measurement run (its progress journal).
+    Websites that failed or are missing in the baseline come first, then the ones it completed.
+    With changed_only, every completed website is fingerprinted (probe_fingerprint) and one whose
+    fingerprint matches the baseline is not crawled: it is journaled as unchanged and points to
+    the baseline's output. The others are crawled anyway and not probed, a dead host would only
+    cost a probe timeout. Probed fingerprints are journaled, as are those of every crawled
+    website (landing_fingerprint), so the run can be the next baseline.
+    Iterating needs no browser and may happen in the worker pool's feeder thread, so the plan
+    opens its own connections to both journals there.
+    """
+
+    def __init__(self, baseline_dir, site_source, journal_path, crawl_metrics, completed=None, changed_only=False, probe_workers=16):
+        self.baseline_path = os.path.join(baseline_dir, JOURNAL_FILENAME)
+        if not os.path.exists(self.baseline_path):
+            raise FileNotFoundError(f"No progress journal in baseline run {baseline_dir}")
+        self.site_source = site_source
+        self.journal_path = journal_path
+        self.crawl_metrics = crawl_metrics
+        self.completed = completed or set()
+        self.changed_only = changed_only
+        self.probe_workers = probe_workers
+
+    def __iter__(self):
+        baseline = ProgressJournal(self.baseline_path)
+        journal = ProgressJournal(self.journal_path)
+        try:
+            for completed_in_baseline in (False, True):
+                sites = self.select(baseline, completed_in_baseline)
+                if not (self.changed_only and completed_in_baseline):
+                    yield from ((website_id, domain) for website_id, domain, _ in sites)
+                    continue
+                for (website_id, domain, previous), fingerprint in probe_sites(sites, workers=self.probe_workers):
+                    journal.record_fingerprint(website_id, domain, fingerprint)
+                    if not fingerprint_changed(previous["fingerprint"], fingerprint):
+                        journal.record_result(website_id, domain, "unchanged", output=previous["output"])
+                        self.crawl_metrics.unchanged.inc()
+                        continue
+                    yield website_id, domain
+        finally:
+            baseline.close()
+            journal.close()
+
+    def select(self, baseline, completed_in_baseline):
+        """
+        One pass over the site source: the websites the baseline did (or did not) complete,
+        without the ones this run already finished.
+        """
+        for website_id, domain in self.site_source():
+            if website_id in self.completed:
+                if not completed_in_baseline:
+                    self.crawl_metrics.skipped.inc()
+                continue
+            previous = baseline.site(website_id)
+            if (previous is not None and previous["status"] in COMPLETED_STATUSES) == completed_in_baseline:
+                yield website_id, domain, previous
@@ -0,0 +1,464 @@
+import os
+import re
+import sys
+import json
+import time
+import base64
+import socket
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from phase_metrics import percentile, METRICS_FILENAME
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Subresource kinds of a fixture page: (extension, content type, HTML referencing it)
+SUBRESOURCE_KINDS = [
+    ("js", "application/javascript", '<script src="{url}"></script>'),
+    ("css", "text/css", '<link rel="stylesheet" href="{url}">'),
+    ("png", "image/png", '<img src="{url}">'),
+]
+
+
+def make_body(size, seed):
+    """
+    Deterministic pseudo-random body, identical across benchmark runs.
+    """
+    return (hashlib.sha256(str(seed).encode()).hexdigest().encode() * (size // 64 + 1))[:size]
+
+
+def generate_self_signed_cert(cert_dir, host):
+    """
+    Self-signed certificate for the HTTPS fixture (selenium-wire does not verify upstream certificates).
+    """
+    cert_path, key_path = os.path.join(cert_dir, "fixture-cert.pem"), os.path.join(cert_dir, "fixture-key.pem")
+    subject_alt_name = f"IP:{host}" if re.fullmatch(r"[\d.]+", host) else f"DNS:{host}"
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "2",
+                    "-keyout", key_path, "-out", cert_path, "-subj", f"/CN={host}",
+                    "-addext", f"subjectAltName={subject_alt_name}"], check=True, capture_output=True)
+    return cert_path, key_path
+
+
+class FixtureWeb:
+    """
+    Local synthetic web for offline benchmarks. Site n lives at <host>:<port>/site/<n>/ and
+    reaches its page through `redirects` redirects; the page loads `subresources` scripts,
+    stylesheets and images of `body_size` bytes and opens `websockets` WebSocket connections
+    that each receive a few messages. All content is deterministic.
+    """
+
+    def __init__(self, sites=50, subresources=20, body_size=20000, redirects=0, websockets=0, host="127.0.0.1", port=0, tls=True):
+        self.sites = sites
+        self.subresources = subresources
+        self.body_size = body_size
+        self.redirects = redirects
+        self.websockets = websockets
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.server = None
+        self.cert_dir = None
+        self.requests_served = 0
+
+    def start(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                fixture.requests_served += 1
+                url = urlsplit(self.path)
+                match = re.fullmatch(r"/site/(\d+)(/.*)?", url.path)
+                if not match or int(match.group(1)) >= fixture.sites:
+                    self.respond(404, "text/plain", b"not found")
+                    return
+                site, rest = int(match.group(1)), match.group(2) or "/"
+
+                resource = re.fullmatch(r"/res/(\d+)\.(\w+)", rest)
+                websocket = re.fullmatch(r"/ws/(\d+)", rest)
+                if resource:
+                    index, extension = int(resource.group(1)), resource.group(2)
+                    content_type = next((kind[1] for kind in SUBRESOURCE_KINDS if kind[0] == extension), "application/octet-stream")
+                    self.respond(200, content_type, make_body(fixture.body_size, f"{site}/{index}"))
+                elif websocket and self.headers.get("Upgrade", "").lower() == "websocket":
+                    self.websocket(site, int(websocket.group(1)))
+                elif rest == "/":
+                    hop = int(parse_qs(url.query).get("hop", ["0"])[0])
+                    if hop < fixture.redirects:
+                        self.send_response(302)
+                        self.send_header("Location", f"/site/{site}/?hop={hop + 1}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                    else:
+                        self.respond(200, "text/html; charset=utf-8", fixture.page(site, self.headers.get("Host")))
+                else:
+                    self.respond(404, "text/plain", b"not found")
+
+            def respond(self, code, content_type, body):
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def websocket(self, site, index):
+                accept = base64.b64encode(hashlib.sha1((self.headers["Sec-WebSocket-Key"] + WEBSOCKET_GUID).encode()).digest()).decode()
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.end_headers()
+                for message in range(3):
+                    payload = json.dumps({"site": site, "socket": index, "message": message}).encode()
+                    self.wfile.write(bytes([0x81, len(payload)]) + payload)
+                    time.sleep(0.1)
+                self.wfile.write(b"\x88\x00")  # Close frame
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        if self.tls:
+            import ssl
+            self.cert_dir = tempfile.mkdtemp(prefix="fixture-cert-")
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*generate_self_signed_cert(self.cert_dir, self.host))
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        threading.Thread(target=self.server.serve_forever, name="fixture-web", daemon=True).start()
+        logging.info(f"Fixture web with {self.sites} sites serving on {self.base_url()}")
+        return self
+
+    def page(self, site, host):
+        scheme = "wss" if self.tls else "ws"
+        lines = ["<!DOCTYPE html>", f"<html><head><title>Fixture site {site}</title></head><body>", f"<h1>Fixture site {site}</h1>"]
+        for index in range(self.subresources):
+            extension, _, template = SUBRESOURCE_KINDS[index % len(SUBRESOURCE_KINDS)]
+            lines.append(template.format(url=f"/site/{site}/res/{index}.{extension}"))
+        for index in range(self.websockets):
+            lines.append(f'<script>new WebSocket("{scheme}://{host}/site/{site}/ws/{index}");</script>')
+        lines.append("</body></html>")
+        return "\n".join(lines).encode()
+
+    def base_url(self):
+        return f"{'https' if self.tls else 'http'}://{self.host}:{self.port}"
+
+    def domains(self):
+        """
+        Crawler input "domains" of the fixture sites; the crawler prepends https://.
+        """
+        return [f"{self.host}:{self.port}/site/{site}" for site in range(self.sites)]
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.cert_dir:
+            shutil.rmtree(self.cert_dir, ignore_errors=True)
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def process_tree_rss(process):
+    """
+    Resident memory in bytes of a process and all its descendants.
+    """
+    total = 0
+    for member in [process] + process.children(recursive=True):
+        try:
+            total += member.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+
+def run_crawl_benchmark(fixture, workers=1, main_args=None, measurements_dir="measurements"):
+    """
+    Crawl the fixture web with the real pipeline (main.py in a subprocess) and report
+    sites/minute, per-site latency, peak RSS of the crawler process tree and output bytes.
+    """
+    input_dir = tempfile.mkdtemp(prefix="benchmark-input-")
+    input_path = os.path.join(input_dir, "fixture_list.csv")
+    with open(input_path, "w", encoding="utf-8") as f:
+        for rank, domain in enumerate(fixture.domains(), start=1):
+            f.write(f"{rank},{domain}\n")
+
+    existing_runs = set(os.listdir(measurements_dir)) if os.path.isdir(measurements_dir) else set()
+    command = [sys.executable, "main.py", "--country", "benchmark", "--headless", "--input", input_path,
+               "--workers", str(workers)] + list(main_args or [])
+    logging.info(f"Running: {' '.join(command)}")
+
+    peak_rss = 0
+    start = time.monotonic()
+    crawler = subprocess.Popen(command)
+    try:
+        process = psutil.Process(crawler.pid) if psutil is not None else None
+        while crawler.poll() is None:
+            if process is not None:
+                peak_rss = max(peak_rss, process_tree_rss(process))
+            time.sleep(0.5)
+    finally:
+        if crawler.poll() is None:
+            crawler.terminate()
+        shutil.rmtree(input_dir, ignore_errors=True)
+    elapsed = time.monotonic() - start
+
+    new_runs = sorted(set(os.listdir(measurements_dir)) - existing_runs) if os.path.isdir(measurements_dir) else []
+    if not new_runs:
+        raise RuntimeError("The crawler did not create a measurement directory")
+    run_dir = os.path.join(measurements_dir, new_runs[-1])
+
+    totals, succeeded = [], set()
+    metrics_path = os.path.join(run_dir, METRICS_FILENAME)
+    if os.path.exists(metrics_path):
+        with open(metrics_path, encoding="utf-8") as f:
+            for line in f:
+                visit = json.loads(line)
+                totals.append(visit["total"])
+                if visit["success"]:
+                    succeeded.add(visit["website_id"])
+    totals.sort()
+
+    return {
+        "run_dir": run_dir,
+        "exit_code": crawler.returncode,
+        "sites": fixture.sites,
+        "sites_succeeded": len(succeeded),
+        "elapsed_seconds": round(elapsed, 1),
+        "sites_per_minute": round(len(succeeded) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "latency_p50": percentile(totals, 50),
+        "latency_p95": percentile(totals, 95),
+        "latency_max": totals[-1] if totals else None,
+        "peak_rss_mb": round(peak_rss / 2 ** 20, 1) if psutil is not None else None,
+        "output_bytes": directory_size(run_dir) - directory_size(os.path.join(run_dir, "browser_profile")),
+        "fixture_requests_served": fixture.requests_served,
+    }
+
+
+def closed_port(host="127.0.0.1"):
+    """
+    A local port nothing listens on.
+    """
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def run_prefilter_benchmark(fixture, dead=50, concurrency=64, timeout=5):
+    """
+    Run the connectivity prefilter over the fixture sites plus `dead` unreachable stand-ins
+    (a closed port, unresolvable names, plain HTTP where HTTPS is expected) and check
+    that it finds every landing URL and fails exactly the dead ones.
+    """
+    from prefilter import ConnectivityPrefilter
+
+    plain = FixtureWeb(sites=dead, subresources=0, tls=False).start()
+    try:
+        port = closed_port(fixture.host)
+        dead_domains = []
+        for index in range(dead):
+            kind = index % 3
+            if kind == 0:
+                dead_domains.append(f"{fixture.host}:{port}/site/{index}")
+            elif kind == 1:
+                dead_domains.append(f"dead-site-{index}.invalid")
+            else:
+                dead_domains.append(plain.domains()[index])
+        sites = list(enumerate(fixture.domains() + dead_domains, start=1))
+
+        start = time.monotonic()
+        probes = {website_id: probe for website_id, _, probe in ConnectivityPrefilter(sites, concurrency=concurrency, timeout=timeout)}
+        elapsed = time.monotonic() - start
+    finally:
+        plain.stop()
+
+    failed_by_class = {}
+    for probe in probes.values():
+        if probe["error_class"]:
+            failed_by_class[probe["error_class"]] = failed_by_class.get(probe["error_class"], 0) + 1
+    hop = f"?hop={fixture.redirects}" if fixture.redirects else ""
+    expected_urls = {website_id: f"{fixture.base_url()}/site/{site}/{hop}" for website_id, site in zip(range(1, fixture.sites + 1), range(fixture.sites))}
+    return {
+        "sites": len(sites),
+        "probed": len(probes),
+        "elapsed_seconds": round(elapsed, 2),
+        "probes_per_second": round(len(probes) / elapsed, 1) if elapsed > 0 else 0.0,
+        "landing_urls_correct": sum(probes.get(website_id, {}).get("landing_url") == url for website_id, url in expected_urls.items()),
+        "dead_failed": sum(1 for website_id, _ in sites[fixture.sites:] if probes.get(website_id, {}).get("error_class")),
+        "failed_by_class": failed_by_class,
+        "probe_p95": percentile(sorted(probe["seconds"] for probe in probes.values()), 95),
+    }
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers, body, date=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.date = date or datetime.now()
+
+
+class FakeRequest:
+    def __init__(self, url, method, headers, response, date=None):
+        self.url = url
+        self.method = method
+        self.headers = headers
+        self.response = response
+        self.date = date or datetime.now()
+        self.body = b""
+        self.ws_messages = []
+
+
+class FakeDriver:
+    """
+    Stand-in for a selenium-wire driver, exposing only the captured requests.
+    """
+
+    def __init__(self, requests):
+        self.requests = requests
+
+
+def make_fake_requests(count=200, body_size=20000):
+    requests = []
+    for index in range(count):
+        extension, content_type, _ = SUBRESOURCE_KINDS[index % len(SUBRESOURCE_KINDS)]
+        url = f"https://cdn{index % 7}.example.com/res/{index}.{extension}?id=u{index}&gclid=abc{index}"
+        headers = {"Host": f"cdn{index % 7}.example.com", "User-Agent": "Mozilla/5.0", "Accept": "*/*"}
+        response = FakeResponse(200, {"Content-Type": content_type, "Content-Length": str(body_size)},
+                                make_body(body_size, index))
+        requests.append(FakeRequest(url, "GET", headers, response))
+    return requests
+
+
+def time_call(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {"best": round(timings[0], 5), "median": round(percentile(timings, 50), 5), "repeat": repeat}
+
+
+def run_micro_benchmarks(requests_per_site=200, body_size=20000, repeat=20):
+    """
+    Time capture_browser_data and store_data_in_csv on a fake driver holding requests_per_site requests.
+    """
+    from utils import capture_browser_data
+    from csv_storage import initialize_csv, store_data_in_csv
+
+    logging.getLogger().setLevel(logging.WARNING)
+    driver = FakeDriver(make_fake_requests(requests_per_site, body_size))
+    output_dir = tempfile.mkdtemp(prefix="benchmark-micro-")
+    output_csv = os.path.join(output_dir, "session.csv")
+    initialize_csv(output_csv)
+    try:
+        return {
+            "requests_per_site": requests_per_site,
+            "body_size": body_size,
+            "capture_browser_data": time_call(lambda: capture_browser_data(driver), repeat),
+            "store_data_in_csv": time_call(lambda: store_data_in_csv("2025-01-01 00:00:00", 1, "https://example.com", driver, output_csv_path=output_csv), repeat),
+            "csv_bytes_per_site": os.path.getsize(output_csv) // repeat,
+        }
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def add_fixture_arguments(parser):
+    parser.add_argument("--sites", type=int, default=50, help="Number of fixture sites. (default: 50)")
+    parser.add_argument("--subresources", type=int, default=20, help="Scripts, stylesheets and images per page. (default: 20)")
+    parser.add_argument("--body-size", type=int, default=20000, help="Bytes per subresource. (default: 20000)")
+    parser.add_argument("--redirects", type=int, default=0, help="Redirects before each page. (default: 0)")
+    parser.add_argument("--websockets", type=int, default=0, help="WebSocket connections per page. (default: 0)")
+    parser.add_argument("--port", type=int, default=0, help="Fixture server port. (default: random free port)")
+    parser.add_argument("--no-tls", action="store_true", default=False, help="Serve plain HTTP (the crawler visits https:// URLs).")
+
+
+def fixture_from_args(args):
+    return FixtureWeb(sites=args.sites, subresources=args.subresources, body_size=args.body_size,
+                      redirects=args.redirects, websockets=args.websockets, port=args.port, tls=not args.no_tls)
+
+
+def write_result(result, output_path=None):
+    print(json.dumps(result, indent=2))
+    if output_path:
+        # One line per benchmark run, so runs can be compared over time
+        with open(output_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(dict(result, timestamp=datetime.now().isoformat())) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline crawler benchmarks against a local fixture web")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    crawl_parser = subparsers.add_parser("crawl", help="Crawl the fixture web with main.py and report throughput")
+    add_fixture_arguments(crawl_parser)
+    crawl_parser.add_argument("--workers", type=int, default=1, help="Crawler --workers. (default: 1)")
+    crawl_parser.add_argument("--output", type=str, default=None, help="Append the result as a JSON line to this file.")
+    crawl_parser.add_argument("main_args", nargs=argparse.REMAINDER, help="Further main.py arguments after --, e.g. -- --browser chrome --reuse-browser 50")
+
+    serve_parser = subparsers.add_parser("serve", help="Only serve the fixture web, e.g. for manual runs")
+    add_fixture_arguments(serve_parser)
+
+    prefilter_parser = subparsers.add_parser("prefilter", help="Run the connectivity prefilter over the fixture web and unreachable stand-ins")
+    add_fixture_arguments(prefilter_parser)
+    prefilter_parser.add_argument("--dead", type=int, default=50, help="Unreachable stand-in sites. (default: 50)")
+    prefilter_parser.add_argument("--concurrency", type=int, default=64, help="Concurrent probes. (default: 64)")
+    prefilter_parser.add_argument("--timeout", type=float, default=5, help="Probe timeout in seconds. (default: 5)")
+    prefilter_parser.add_argument("--output", type=str, default=None, help="Append the result as a JSON line to this file.")
+
+    micro_parser = subparsers.add_parser("micro", help="Micro-benchmarks of request capture and CSV storage with a fake driver")
+    micro_parser.add_argument("--requests", type=int, default=200, help="Captured requests per site. (default: 200)")
+    micro_parser.add_argument("--body-size", type=int, default=20000, help="Response body bytes. (default: 20000)")
+    micro_parser.add_argument("--repeat", type=int, default=20, help="Timed repetitions. (default: 20)")
+    micro_parser.add_argument("--output", type=str, default=None, help="Append the result as a JSON line to this file.")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "micro":
+        write_result(run_micro_benchmarks(args.requests, args.body_size, args.repeat), args.output)
+    else:
+        fixture = fixture_from_args(args).start()
+        try:
+            if args.command == "serve":
+                for domain in fixture.domains():
+                    print(domain)
+                while True:
+                    time.sleep(3600)
+            elif args.command == "prefilter":
+                write_result(run_prefilter_benchmark(fixture, dead=args.dead, concurrency=args.concurrency, timeout=args.timeout), args.output)
+            else:
+                main_args = [arg for arg in args.main_args if arg != "--"]
+                write_result(run_crawl_benchmark(fixture, workers=args.workers, main_args=main_args), args.output)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            fixture.stop()
@@ -0,0 +1,62 @@
+import os
+import hashlib
+import logging
+import tempfile
+
+
+class BlobStore:
+    """
+    Content-addressed store for response bodies. Every distinct body is written once to
+    <root>/<first 2 hex chars>/<sha256>, so the same library, analytics script or font
+    fetched by thousands of websites costs a single file.
+    Safe to share between worker processes: blobs are written to a temporary file and
+    atomically renamed into place. Which bodies are stored is up to the CapturePolicy.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.known_digests = set()
+        os.makedirs(root, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, body):
+        """
+        Store a body and return its sha256 hex digest.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        if digest in self.known_digests:
+            return digest
+
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        self.known_digests.add(digest)
+        return digest
+
+    def store_body(self, body):
+        """
+        Fields of a request record describing the body: digest and size.
+        """
+        if not body:
+            return {'response_body_sha256': None, 'response_body_size': 0, 'response_body_skipped': None}
+        try:
+            digest = self.put(body)
+        except OSError as e:
+            logging.error(f"Failed to store response body: {e}")
+            return {'response_body_sha256': None, 'response_body_size': len(body), 'response_body_skipped': "error"}
+        return {'response_body_sha256': digest, 'response_body_size': len(body), 'response_body_skipped': None}
+
+    def read(self, digest):
+        with open(self.blob_path(digest), 'rb') as f:
+            return f.read()
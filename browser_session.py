@@ -0,0 +1,167 @@
+import shutil
+import logging
+from urllib.parse import urlparse
+
+from setup_webdriver import setup_webdriver, close_browser, get_driver_pid, get_process_tree, stateless_profile_dir
+from utils import NetworkActivity
+
+
+class BrowserSession:
+    """
+    Owns the browser of one crawl worker.
+    With relaunch_every=1 (default) a fresh browser is launched for every website, otherwise the
+    browser is kept warm and its state (cookies, storage, cache, service workers, captured requests)
+    is wiped between websites. It is fully relaunched every relaunch_every websites, after an error,
+    or whenever the state could not be wiped. The profile directory of a browser is deleted when it
+    is closed, so a relaunched browser never inherits the state of earlier websites. Chromium browsers clear storage per origin, taken from
+    the captured requests, so they are relaunched for every website when the capture policy keeps
+    origins out of the captured requests.
+    """
+
+    def __init__(self, browser, headless=True, proxy_port=None, relaunch_every=1, profile_path=None, capture=None, seleniumwire_overrides=None, capture_policy=None, websockets=None):
+        self.browser = browser
+        self.headless = headless
+        self.proxy_port = proxy_port
+        self.relaunch_every = max(1, relaunch_every)
+        self.profile_path = profile_path
+        # Optional StreamingCapture, its interceptors are installed on every launched browser
+        self.capture = capture
+        # Optional WebSocketCapture, receives the WebSocket messages of every launched browser
+        self.websockets = websockets
+        # Request/response counts polled while the page settles, the streaming capture keeps its own
+        self.activity = capture if capture is not None else NetworkActivity()
+        self.seleniumwire_overrides = seleniumwire_overrides
+        self.capture_policy = capture_policy
+        if self.relaunch_every > 1 and browser != "firefox" and capture_policy is not None and capture_policy.hides_origins():
+            logging.warning("The capture policy hides origins from the browser state wipe, relaunching the browser for every website.")
+            self.relaunch_every = 1
+            # Like a fresh browser per website: no profile directory shared between launches
+            self.profile_path = None
+        self.driver = None
+        self.launch_profile_path = None
+        self.sites_since_launch = 0
+        self.relaunch_reason = None
+
+    def acquire(self, browser_profile_path=None):
+        """
+        Return a driver with clean state for the next website.
+        """
+        if self.driver is not None and self.sites_since_launch >= self.relaunch_every:
+            logging.info(f"Relaunching browser after {self.sites_since_launch} websites.")
+            self.close()
+
+        if self.driver is not None and self.relaunch_reason:
+            logging.info(f"Relaunching browser: {self.relaunch_reason}")
+            self.close()
+
+        if self.driver is not None and not self.reset_state():
+            logging.warning("Browser state reset failed, relaunching browser.")
+            self.close()
+
+        if self.driver is None:
+            self.launch_profile_path = self.profile_path or browser_profile_path
+            self.driver = setup_webdriver(self.browser, headless=self.headless, stateful=False,
+                                          browser_profile_path=self.launch_profile_path,
+                                          proxy_port=self.proxy_port,
+                                          seleniumwire_overrides=self.seleniumwire_overrides,
+                                          capture_policy=self.capture_policy)
+            self.activity.attach(self.driver)
+            if self.websockets is not None:
+                self.websockets.attach(self.driver)
+            self.sites_since_launch = 0
+
+        self.sites_since_launch += 1
+        return self.driver
+
+    def release(self):
+        """
+        Called after a successful website visit. Closes the browser unless it is kept warm.
+        """
+        if self.relaunch_every == 1:
+            self.close()
+
+    def request_relaunch(self, reason):
+        """
+        Relaunch the browser before the next website, e.g. when it exceeds its memory budget.
+        Safe to call from another thread, the browser is only closed by the crawl thread.
+        """
+        if self.driver is not None and not self.relaunch_reason:
+            self.relaunch_reason = reason
+
+    def process_tree(self):
+        """
+        psutil processes of the running browser session (driver service, browser, children).
+        """
+        if self.driver is None:
+            return []
+        return get_process_tree(get_driver_pid(self.driver))
+
+    def close(self):
+        if self.driver is None:
+            return
+        try:
+            close_browser(self.driver, self.browser)
+        finally:
+            self.driver = None
+            self.sites_since_launch = 0
+            self.relaunch_reason = None
+            # Cookies, storage, cache and service workers on disk must not reach the next launch
+            if self.launch_profile_path:
+                shutil.rmtree(stateless_profile_dir(self.launch_profile_path), ignore_errors=True)
+                self.launch_profile_path = None
+
+    def reset_state(self):
+        """
+        Wipe all per-site state from the running browser. Returns False if the browser
+        could not be reset, in which case it must be relaunched.
+        """
+        driver = self.driver
+        try:
+            # Origins the previous website talked to, their storage is cleared below
+            origins = {f"{urlparse(req.url).scheme}://{urlparse(req.url).netloc}" for req in driver.requests}
+            if self.capture is not None:
+                # Streamed requests are no longer held by selenium-wire
+                origins |= self.capture.origins
+
+            # Keep a single tab and leave the previous website
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.get("about:blank")
+
+            if self.browser == "firefox":
+                clear_firefox_data(driver)
+            else:
+                clear_chromium_data(driver, origins)
+
+            # Drop requests captured for the previous website
+            del driver.requests
+            logging.debug(f"Browser state reset ({len(origins)} origins cleared).")
+            return True
+        except Exception as e:
+            logging.warning(f"Failed to reset browser state: {e}")
+            return False
+
+
+def clear_chromium_data(driver, origins):
+    """
+    Clear cookies, cache and per-origin storage (incl. service workers) via the DevTools protocol.
+    """
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+    for origin in origins:
+        driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+
+
+def clear_firefox_data(driver):
+    """
+    Clear all site data (cookies, storage, cache, service workers) through Firefox's
+    privileged clear-data service.
+    """
+    with driver.context(driver.CONTEXT_CHROME):
+        driver.execute_async_script("""
+            const done = arguments[arguments.length - 1];
+            Services.clearData.deleteData(Ci.nsIClearDataService.CLEAR_ALL, () => done(true));
+        """)
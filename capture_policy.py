@@ -0,0 +1,153 @@
+import re
+import json
+import logging
+
+
+# Capture everything with full bodies, as before capture policies existed
+DEFAULT_CAPTURE_POLICY = {
+    "scopes": [],                     # URL regexes to capture, empty captures every URL
+    "excludes": [],                   # URL regexes never captured (still proxied)
+    "exclude_hosts": [],              # Hosts bypassing the proxy entirely (no TLS interception)
+    "ignore_http_methods": [],        # HTTP methods never captured, e.g. ["OPTIONS"]
+    "headers_only": False,            # Drop all response bodies from the records
+    "max_body_size": None,            # Largest response body in bytes kept in the records
+    "body_content_types": [],         # Content type prefixes whose bodies are kept, empty keeps all
+    "body_skip_content_types": [],    # Content type prefixes whose bodies are never kept
+    "request_storage": "disk",        # selenium-wire request storage: disk or memory
+    "request_storage_base_dir": None, # Directory of the disk storage (default: system temp dir)
+    "request_storage_max_size": None, # Requests kept by the memory storage
+    "request_timeout": 240,
+}
+
+# Bodies left out of the --body-store unless --body-skip-mime says otherwise, media is never analyzed
+MEDIA_CONTENT_TYPES = ["image/", "video/", "audio/", "font/"]
+
+
+class CapturePolicy:
+    """
+    What the selenium-wire proxy captures and which response bodies end up in the records,
+    identical for every browser backend. Loaded from a JSON file (--capture-policy), keys
+    as in DEFAULT_CAPTURE_POLICY; missing keys keep their default.
+    """
+
+    def __init__(self, **policy):
+        unknown = set(policy) - set(DEFAULT_CAPTURE_POLICY)
+        if unknown:
+            raise ValueError(f"Unknown capture policy keys: {', '.join(sorted(unknown))}")
+        self.policy = dict(DEFAULT_CAPTURE_POLICY, **policy)
+        if self.policy["request_storage"] not in ("disk", "memory"):
+            raise ValueError(f"Unknown request storage: {self.policy['request_storage']}")
+        self.body_content_types = [mime.lower() for mime in self.policy["body_content_types"]]
+        self.body_skip_content_types = [mime.lower() for mime in self.policy["body_skip_content_types"]]
+        # Fail on invalid regexes at startup rather than inside the proxy
+        for pattern in self.policy["scopes"] + self.policy["excludes"]:
+            re.compile(pattern)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(**json.load(f))
+
+    def to_dict(self):
+        return dict(self.policy)
+
+    def updated(self, **policy):
+        """
+        Copy of the policy with some keys replaced, e.g. by command line flags.
+        """
+        return CapturePolicy(**dict(self.policy, **policy))
+
+    def hides_origins(self):
+        """
+        Whether some of the origins a page talks to may never show up among the captured requests.
+        CORS preflights (OPTIONS) are always followed by a captured request to the same origin.
+        """
+        return bool(self.policy["scopes"] or self.policy["excludes"] or self.policy["exclude_hosts"]
+                    or set(method.upper() for method in self.policy["ignore_http_methods"]) - {"OPTIONS"})
+
+    def seleniumwire_options(self, proxy_port=None):
+        """
+        selenium-wire options of a browser launched under this policy.
+        """
+        options = {
+            'ignore_http_methods': list(self.policy["ignore_http_methods"]),
+            'request_timeout': self.policy["request_timeout"],
+            'disable_encoding': True,
+            'port': proxy_port or 0,
+            'request_storage': self.policy["request_storage"],
+        }
+        if self.policy["exclude_hosts"]:
+            options['exclude_hosts'] = list(self.policy["exclude_hosts"])
+        if self.policy["request_storage_base_dir"]:
+            options['request_storage_base_dir'] = self.policy["request_storage_base_dir"]
+        if self.policy["request_storage_max_size"]:
+            options['request_storage_max_size'] = self.policy["request_storage_max_size"]
+        return options
+
+    def scope_pattern(self):
+        """
+        Single regex for driver.scopes combining scopes and excludes, None to capture every URL.
+        selenium-wire matches scopes with re.search, so both are encoded as lookaheads.
+        """
+        scopes, excludes = self.policy["scopes"], self.policy["excludes"]
+        if not scopes and not excludes:
+            return None
+        pattern = "^"
+        if excludes:
+            pattern += "(?!.*(?:" + "|".join(excludes) + "))"
+        if scopes:
+            pattern += "(?=.*(?:" + "|".join(scopes) + "))"
+        return pattern
+
+    def filters_bodies(self):
+        return bool(self.policy["headers_only"] or self.policy["max_body_size"] is not None
+                    or self.body_content_types or self.body_skip_content_types)
+
+    def apply(self, driver):
+        """
+        Restrict the capture of a launched driver to the policy's URL scope, and keep the bodies
+        the policy excludes out of selenium-wire's request storage. The browser still receives
+        them: a response interceptor's changes would be sent on, so storing is intercepted instead.
+        """
+        pattern = self.scope_pattern()
+        if pattern is not None:
+            driver.scopes = [pattern]
+        if not self.filters_bodies():
+            return
+        storage = getattr(getattr(driver, "backend", None), "storage", None)
+        if storage is None:
+            logging.warning("selenium-wire storage not found, excluded response bodies are stored.")
+            return
+        save_response = storage.save_response
+
+        def save_filtered_response(request_id, response):
+            self.drop_body(response)
+            save_response(request_id, response)
+
+        storage.save_response = save_filtered_response
+
+    def drop_body(self, response):
+        """
+        Empty the body of a selenium-wire response the policy excludes. Its skip reason and
+        size are kept as response.body_skipped for the record.
+        """
+        body = response.body
+        skip_reason = self.body_skip_reason(body, response.headers.get('Content-Type')) if body else None
+        if skip_reason is not None:
+            response.body_skipped = (skip_reason, len(body))
+            response.body = b""
+
+    def body_skip_reason(self, body, content_type):
+        """
+        Why a response body is left out of the records, or None if it is kept.
+        """
+        if self.policy["headers_only"]:
+            return "headers_only"
+        content_type = (content_type or "").lower()
+        if self.body_content_types and not any(content_type.startswith(mime) for mime in self.body_content_types):
+            return "mime_type"
+        if any(content_type.startswith(mime) for mime in self.body_skip_content_types):
+            return "mime_type"
+        if self.policy["max_body_size"] is not None and len(body) > self.policy["max_body_size"]:
+            return "size"
+        return None
@@ -1,7 +1,30 @@
 import shutil
 import subprocess
 import os
+import json
+import base64
+import hashlib
 import logging
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+SYSTEM_CERT_PATH = "/usr/local/share/ca-certificates/seleniumwire.crt"
+SYSTEM_CA_BUNDLE = "/etc/ssl/certs/ca-certificates.crt"
+NSS_CERT_NAME = "Selenium Wire CA"
+
+
+def cert_refs_path():
+    """
+    File of the crawler processes currently relying on the installed certificate, shared by all
+    runs of the user. Per user (uid), like the NSS DB the certificate goes into; the temp dir is
+    shared, and another user's file can neither be locked nor written.
+    """
+    return os.path.join(tempfile.gettempdir(), f"generic_crawler_cert_refs_{os.getuid()}.json")
 
 def get_seleniumwire_cert_path():
     return "mitm-ca.crt"
@@ -60,16 +83,132 @@ def initialize_nss_db(nss_db):
         logging.error(e)
     
     
+def pem_fingerprints(pem_text):
+    """
+    SHA-256 fingerprints of all certificates in a PEM text.
+    """
+    fingerprints = set()
+    for block in pem_text.split("-----BEGIN CERTIFICATE-----")[1:]:
+        body = block.split("-----END CERTIFICATE-----")[0]
+        try:
+            fingerprints.add(hashlib.sha256(base64.b64decode("".join(body.split()))).hexdigest())
+        except ValueError:
+            continue
+    return fingerprints
+
+
+def read_text(path):
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def is_cert_trusted_system(cert_path):
+    """
+    True if the certificate is installed and already part of the system CA bundle.
+    """
+    fingerprints = pem_fingerprints(read_text(cert_path))
+    return bool(fingerprints) and fingerprints <= pem_fingerprints(read_text(SYSTEM_CERT_PATH)) \
+        and fingerprints <= pem_fingerprints(read_text(SYSTEM_CA_BUNDLE))
+
+
+def is_cert_trusted_nss(nss_db, cert_path):
+    """
+    True if the user NSS DB already holds this exact certificate.
+    """
+    result = subprocess.run(["certutil", "-L", "-d", f"sql:{nss_db}", "-n", NSS_CERT_NAME, "-a"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return False
+    fingerprints = pem_fingerprints(read_text(cert_path))
+    return bool(fingerprints) and fingerprints <= pem_fingerprints(result.stdout)
+
+
+def update_cert_refs(change):
+    """
+    Update the user's set of crawler PIDs using the certificate under an exclusive file lock.
+    change(pids) mutates the set of live PIDs; returns the resulting set.
+    Dead PIDs (crashed runs) are dropped, so they never keep the certificate installed.
+    """
+    refs_path = cert_refs_path()
+    with open(refs_path + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                pids = set(json.loads(read_text(refs_path) or "[]"))
+            except ValueError:
+                pids = set()
+            pids = {pid for pid in pids if is_process_alive(pid)}
+            result = change(pids)
+            with open(refs_path, "w") as f:
+                json.dump(sorted(pids), f)
+            return result
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def acquire_cert_linux(system_wide=True, user_nss=True):
+    """
+    Register this crawler as a user of the certificate and install it if it is not trusted yet.
+    Concurrent runs share one installation.
+    """
+    def register(pids):
+        pids.add(os.getpid())
+        # Installing inside the lock keeps concurrent starts from racing
+        install_cert_linux(system_wide=system_wide, user_nss=user_nss)
+    try:
+        update_cert_refs(register)
+    except OSError as e:
+        logging.warning(f"Cannot track the crawlers using the certificate ({e}), installing it without.")
+        install_cert_linux(system_wide=system_wide, user_nss=user_nss)
+
+
+def release_cert_linux(system_wide=True, user_nss=True):
+    """
+    Unregister this crawler; the certificate is removed only when the last running crawler exits.
+    """
+    def unregister(pids):
+        pids.discard(os.getpid())
+        if pids:
+            logging.info(f"Certificate still used by {len(pids)} other crawler(s), keeping it installed.")
+            return
+        remove_cert_linux(system_wide=system_wide, user_nss=user_nss)
+    try:
+        update_cert_refs(unregister)
+    except OSError as e:
+        logging.warning(f"Cannot track the crawlers using the certificate ({e}), keeping it installed.")
+
+
 def install_cert_linux(system_wide=True, user_nss=True):
+    """
+    Install the certificate system-wide and/or in the user NSS DB.
+    Stores that already trust this exact certificate are skipped.
+    """
     cert_path = get_seleniumwire_cert_path()
 
     if not os.path.exists(cert_path):
         logging.error(f"Certificate not found at: {cert_path}")
         return
 
-    if system_wide:
+    if system_wide and is_cert_trusted_system(cert_path):
+        logging.info("Cert already trusted system-wide, skipping installation.")
+    elif system_wide:
         # System-wide CA trust
-        dst_path = f"/usr/local/share/ca-certificates/seleniumwire.crt"
+        dst_path = SYSTEM_CERT_PATH
         try:
             logging.info("Installing cert system-wide...\n")
             subprocess.run(["sudo", "cp", cert_path, dst_path], check=True)
@@ -84,6 +223,10 @@ def install_cert_linux(system_wide=True, user_nss=True):
             nss_db = os.path.expanduser("~/.pki/nssdb")
             os.makedirs(nss_db, exist_ok=True)
 
+            if is_cert_trusted_nss(nss_db, cert_path):
+                logging.info("Cert already trusted in user NSS DB, skipping installation.")
+                return
+
             if not is_nss_db_usable(nss_db):
                 logging.warning("⚠️ NSS DB unusable or missing. Re-initializing...")
                 shutil.rmtree(nss_db, ignore_errors=True)
@@ -93,7 +236,7 @@ def install_cert_linux(system_wide=True, user_nss=True):
             logging.info("Installing cert in user NSS DB...")
             subprocess.run([
                 "certutil", "-A", "-d", f"sql:{nss_db}",
-                "-n", "Selenium Wire CA", "-t", "C,,", "-i", cert_path
+                "-n", NSS_CERT_NAME, "-t", "C,,", "-i", cert_path
             ], check=True)
             logging.info("NSS trust installed.")
         except subprocess.CalledProcessError as e:
@@ -105,8 +248,9 @@ def remove_cert_linux(system_wide=True, user_nss=True):
     if system_wide:
         try:
             logging.info("Removing system-wide cert...")
-            subprocess.run(["sudo", "rm", "/usr/local/share/ca-certificates/seleniumwire.crt"], check=True)
-            subprocess.run(["sudo", "update-ca-certificates", "--fresh"], check=True)
+            subprocess.run(["sudo", "rm", SYSTEM_CERT_PATH], check=True)
+            # A plain update drops removed certificates, --fresh would rebuild every link
+            subprocess.run(["sudo", "update-ca-certificates"], check=True)
             logging.info("Removed from system trust.")
         except subprocess.CalledProcessError as e:
             logging.error("Failed to remove system cert.")
@@ -117,7 +261,7 @@ def remove_cert_linux(system_wide=True, user_nss=True):
             logging.info("Removing cert from user NSS DB...")
             nss_db = os.path.expanduser("~/.pki/nssdb")
             subprocess.run([
-                "certutil", "-D", "-d", f"sql:{nss_db}", "-n", "Selenium Wire CA"
+                "certutil", "-D", "-d", f"sql:{nss_db}", "-n", NSS_CERT_NAME
             ], check=True)
             logging.info("Removed from user NSS store.")
         except subprocess.CalledProcessError as e:
@@ -1,9 +0,0 @@
-summary_data = {
-        "Measurement Start Time": None,
-        "Measurement End Time": None,
-        "Number of websites visited": 0,
-        "Country": None,
-        "Browser": None,
-        "Headless mode": None,
-        "Hourly Checkpoints": [],
-    }
\ No newline at end of file
@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import glob
+import shutil
+import sqlite3
+import logging
+import argparse
+import threading
+import urllib.request
+from datetime import datetime
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from output_sinks import OUTPUT_FILES
+from output_readers import detect_output_format
+from tranco_input import read_tranco_csv
+from websocket_capture import WEBSOCKET_FILENAME
+
+
+COORDINATOR_FILENAME = "coordinator.sqlite"
+
+
+class LeaseStore:
+    """
+    Central state of a multi-host crawl: the rank ranges of the run, handed out as leases.
+    A lease that is not renewed within lease_seconds expires and goes back to the pool.
+    Works as a shared SQLite file or behind the HTTP service of this module.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                lease_id INTEGER PRIMARY KEY,
+                start_rank INTEGER,
+                end_rank INTEGER,
+                status TEXT DEFAULT 'pending',
+                host TEXT,
+                expires_at REAL,
+                attempts INTEGER DEFAULT 0,
+                sites INTEGER,
+                failed INTEGER,
+                completed_at TEXT
+            )
+        """)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def transaction(self):
+        """
+        Write transaction, exclusive across threads and, through the SQLite file lock, across hosts.
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def create_run(self, run_id, first_rank, last_rank, lease_size, lease_seconds):
+        """
+        Split ranks first_rank..last_rank into leases of lease_size ranks. Keeps an existing run.
+        """
+        with self.transaction() as connection:
+            if connection.execute("SELECT value FROM meta WHERE key = 'run_id'").fetchone():
+                logging.info(f"Coordinator database {self.path} already holds a run, keeping it.")
+                return
+            connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ("run_id", run_id), ("lease_seconds", str(lease_seconds)),
+            ])
+            connection.executemany("INSERT INTO leases (start_rank, end_rank) VALUES (?, ?)", [
+                (start, min(start + lease_size - 1, last_rank)) for start in range(first_rank, last_rank + 1, lease_size)
+            ])
+
+    def info(self):
+        meta = dict(self.connection.execute("SELECT key, value FROM meta"))
+        if "run_id" not in meta:
+            raise RuntimeError(f"No coordinated run in {self.path}, create it with 'coordinator.py init'")
+        return {"run_id": meta["run_id"], "lease_seconds": float(meta["lease_seconds"])}
+
+    def acquire(self, host):
+        """
+        Lease the lowest pending rank range to host, reclaiming expired leases first.
+        Returns {"lease": {"lease_id", "start_rank", "end_rank"} or None, "remaining": leases not done}.
+        """
+        lease_seconds = self.info()["lease_seconds"]
+        now = time.time()
+        with self.transaction() as connection:
+            expired = connection.execute("UPDATE leases SET status = 'pending', host = NULL "
+                                         "WHERE status = 'leased' AND expires_at < ?", (now,)).rowcount
+            if expired:
+                logging.warning(f"{expired} expired lease(s) returned to the pool")
+            row = connection.execute("SELECT lease_id, start_rank, end_rank FROM leases "
+                                     "WHERE status = 'pending' ORDER BY start_rank LIMIT 1").fetchone()
+            if row is not None:
+                connection.execute("UPDATE leases SET status = 'leased', host = ?, expires_at = ?, attempts = attempts + 1 "
+                                   "WHERE lease_id = ?", (host, now + lease_seconds, row[0]))
+            remaining = connection.execute("SELECT COUNT(*) FROM leases WHERE status != 'done'").fetchone()[0]
+        lease = {"lease_id": row[0], "start_rank": row[1], "end_rank": row[2]} if row else None
+        return {"lease": lease, "remaining": remaining}
+
+    def renew(self, lease_id, host):
+        """
+        Extend a lease still held by host. False if it expired and was handed to another host.
+        """
+        lease_seconds = self.info()["lease_seconds"]
+        with self.transaction() as connection:
+            return connection.execute("UPDATE leases SET expires_at = ? WHERE lease_id = ? AND host = ? AND status = 'leased'",
+                                      (time.time() + lease_seconds, lease_id, host)).rowcount == 1
+
+    def complete(self, lease_id, host, sites=0, failed=0):
+        """
+        Mark a lease as done. Completion is accepted even after expiry, the work is finished either way.
+        """
+        with self.transaction() as connection:
+            connection.execute("UPDATE leases SET status = 'done', host = ?, sites = ?, failed = ?, completed_at = ? "
+                               "WHERE lease_id = ? AND status != 'done'",
+                               (host, sites, failed, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), lease_id))
+        return True
+
+    def status(self):
+        counts = dict(self.connection.execute("SELECT status, COUNT(*) FROM leases GROUP BY status"))
+        hosts = dict(self.connection.execute("SELECT host, COUNT(*) FROM leases WHERE status = 'leased' GROUP BY host"))
+        sites, failed = self.connection.execute("SELECT COALESCE(SUM(sites), 0), COALESCE(SUM(failed), 0) FROM leases").fetchone()
+        return {"leases": counts, "active_hosts": hosts, "sites": sites, "failed": failed}
+
+    def close(self):
+        self.connection.close()
+
+
+class HttpLeaseClient:
+    """
+    Client of a LeaseStore served by 'coordinator.py serve', same methods as LeaseStore.
+    """
+
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def call(self, endpoint, payload=None):
+        request = urllib.request.Request(f"{self.url}/{endpoint}", data=json.dumps(payload or {}).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def info(self):
+        return self.call("info")
+
+    def acquire(self, host):
+        return self.call("acquire", {"host": host})
+
+    def renew(self, lease_id, host):
+        return self.call("renew", {"lease_id": lease_id, "host": host})
+
+    def complete(self, lease_id, host, sites=0, failed=0):
+        return self.call("complete", {"lease_id": lease_id, "host": host, "sites": sites, "failed": failed})
+
+    def status(self):
+        return self.call("status")
+
+    def close(self):
+        pass
+
+
+def connect_coordinator(location):
+    """
+    Lease client for --coordinator: an http(s):// URL of 'coordinator.py serve', or the path of a shared coordinator SQLite file.
+    """
+    if location.startswith(("http://", "https://")):
+        return HttpLeaseClient(location)
+    if not os.path.exists(location):
+        raise FileNotFoundError(f"Coordinator database not found: {location}")
+    return LeaseStore(location)
+
+
+def serve(store, host="0.0.0.0", port=8765):
+    """
+    Serve a LeaseStore over HTTP: POST /info, /acquire, /renew, /complete and /status with JSON bodies.
+    """
+    endpoints = {
+        "info": lambda payload: store.info(),
+        "acquire": lambda payload: store.acquire(payload["host"]),
+        "renew": lambda payload: store.renew(payload["lease_id"], payload["host"]),
+        "complete": lambda payload: store.complete(payload["lease_id"], payload["host"], payload.get("sites", 0), payload.get("failed", 0)),
+        "status": lambda payload: store.status(),
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            endpoint = endpoints.get(self.path.strip("/"))
+            if endpoint is None:
+                self.send_error(404)
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                result = endpoint(json.loads(self.rfile.read(length) or b"{}"))
+                body, code = json.dumps(result).encode(), 200
+            except Exception as e:
+                logging.error(f"Coordinator request /{self.path.strip('/')} failed: {e}")
+                body, code = json.dumps({"error": str(e)}).encode(), 500
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"{self.address_string()} - {format % args}")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logging.info(f"Coordinator of run {store.info()['run_id']} listening on {host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class LeasedSites:
+    """
+    Site iterator of a host in a coordinated run: leases rank ranges from the coordinator and
+    yields their websites through site_filter(start_rank, end_rank). A heartbeat thread renews
+    the held leases; a lease is completed once every one of its websites got a final result
+    (record_final). When no lease is free but others are still running, waits for them,
+    as expired leases come back to the pool.
+    """
+
+    def __init__(self, client, host_id, site_filter, completed=None, poll_interval=10):
+        self.client = client
+        self.host_id = host_id
+        self.site_filter = site_filter
+        self.completed = completed or set()
+        self.poll_interval = poll_interval
+        self.lease_seconds = client.info()["lease_seconds"]
+        self.lock = threading.Lock()
+        self.active = {}
+        self.site_leases = {}
+        self.stop = threading.Event()
+        self.heartbeat = None
+
+    def __iter__(self):
+        self.heartbeat = threading.Thread(target=self.renew_leases, name="lease-heartbeat", daemon=True)
+        self.heartbeat.start()
+        while not self.stop.is_set():
+            response = self.client.acquire(self.host_id)
+            lease = response["lease"]
+            if lease is None:
+                if not response["remaining"]:
+                    return
+                self.stop.wait(self.poll_interval)
+                continue
+
+            lease_id = lease["lease_id"]
+            logging.info(f"Leased ranks {lease['start_rank']}-{lease['end_rank']} (lease #{lease_id})")
+            with self.lock:
+                self.active[lease_id] = {"outstanding": 0, "exhausted": False, "sites": 0, "failed": 0}
+            for website_id, domain in self.site_filter(lease["start_rank"], lease["end_rank"]):
+                if website_id in self.completed:
+                    continue
+                with self.lock:
+                    self.active[lease_id]["outstanding"] += 1
+                    self.site_leases[website_id] = lease_id
+                yield website_id, domain
+            with self.lock:
+                self.active[lease_id]["exhausted"] = True
+            self.complete_if_done(lease_id)
+
+    def record_final(self, website_id, success=True):
+        """
+        A website of a lease is finished (done or finally failed, not pending a retry).
+        """
+        with self.lock:
+            lease_id = self.site_leases.pop(website_id, None)
+            if lease_id is None:
+                return
+            state = self.active[lease_id]
+            state["outstanding"] -= 1
+            state["sites"] += 1
+            state["failed"] += 0 if success else 1
+        self.complete_if_done(lease_id)
+
+    def complete_if_done(self, lease_id):
+        with self.lock:
+            state = self.active.get(lease_id)
+            if state is None or not state["exhausted"] or state["outstanding"] > 0:
+                return
+            del self.active[lease_id]
+        self.client.complete(lease_id, self.host_id, sites=state["sites"], failed=state["failed"])
+        logging.info(f"Lease #{lease_id} completed ({state['sites']} websites, {state['failed']} failed)")
+
+    def renew_leases(self):
+        while not self.stop.wait(self.lease_seconds / 3):
+            with self.lock:
+                lease_ids = list(self.active)
+            for lease_id in lease_ids:
+                try:
+                    if not self.client.renew(lease_id, self.host_id):
+                        logging.warning(f"Lease #{lease_id} expired and was handed to another host, its websites may be crawled twice")
+                except Exception as e:
+                    logging.warning(f"Failed to renew lease #{lease_id}: {e}")
+
+    def close(self):
+        self.stop.set()
+        self.client.close()
+
+
+def merge_host_runs(run_dir):
+    """
+    Merge the host directories of a coordinated run (<run_dir>/<host_id>/, copied from every host)
+    into one run output in run_dir, which analyze.py and extract_ids.py then read like a single-host run.
+    Host directories are left untouched, so merging again after more hosts finished is safe.
+    """
+    host_dirs = []
+    for host_dir in sorted(glob.glob(os.path.join(run_dir, "*", ""))):
+        try:
+            host_dirs.append((host_dir, detect_output_format(host_dir)))
+        except FileNotFoundError:
+            continue
+    formats = {output_format for _, output_format in host_dirs}
+    if len(formats) > 1:
+        raise ValueError(f"Hosts of {run_dir} used different output formats: {', '.join(sorted(formats))}")
+    if not host_dirs:
+        raise FileNotFoundError(f"No host outputs found in {run_dir}")
+    output_format = formats.pop()
+    output_path = os.path.join(run_dir, OUTPUT_FILES[output_format])
+
+    if output_format == "parquet":
+        shutil.rmtree(output_path, ignore_errors=True)
+        os.makedirs(output_path)
+        for host_dir, _ in host_dirs:
+            host = os.path.basename(os.path.normpath(host_dir))
+            for part in glob.glob(os.path.join(host_dir, OUTPUT_FILES[output_format], "*.parquet")):
+                shutil.copyfile(part, os.path.join(output_path, f"{host}-{os.path.basename(part)}"))
+    else:
+        with open(output_path, 'wb') as out:
+            for index, (host_dir, _) in enumerate(host_dirs):
+                with open(os.path.join(host_dir, OUTPUT_FILES[output_format]), 'rb') as part:
+                    if output_format == "csv" and index > 0:
+                        part.readline()  # Keep a single header row
+                    shutil.copyfileobj(part, out)
+
+    # Streams that concatenate as they are (JSON lines, gzip members)
+    for filename in ("metrics.jsonl", WEBSOCKET_FILENAME):
+        host_paths = [os.path.join(host_dir, filename) for host_dir, _ in host_dirs if os.path.exists(os.path.join(host_dir, filename))]
+        if not host_paths:
+            continue
+        with open(os.path.join(run_dir, filename), 'wb') as out:
+            for path in host_paths:
+                with open(path, 'rb') as part:
+                    shutil.copyfileobj(part, out)
+    logging.info(f"Merged {len(host_dirs)} host outputs into {output_path}")
+    return len(host_dirs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coordinate one measurement run across several crawler hosts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    init_parser = subparsers.add_parser("init", help="Create a coordinated run: split the rank range into leases")
+    init_parser.add_argument("--db", type=str, default=COORDINATOR_FILENAME, help=f"Coordinator SQLite file. (default: {COORDINATOR_FILENAME})")
+    init_parser.add_argument("--run-id", type=str, default=datetime.now().strftime('%Y-%m-%d_%H-%M-%S'), help="Name of the run directory on every host. (default: current time)")
+    init_parser.add_argument("--input", type=str, default=os.path.join("crawling_csv", "tranco_list.csv"), help="Rank-ordered 'rank,domain' CSV, used for the last rank. (default: crawling_csv/tranco_list.csv)")
+    init_parser.add_argument("--start-rank", type=int, default=1, help="First rank to crawl. (default: 1)")
+    init_parser.add_argument("--end-rank", type=int, default=None, help="Last rank to crawl. (default: last rank of --input)")
+    init_parser.add_argument("--lease-size", type=int, default=500, help="Ranks per lease. Use a multiple of --bucket-size when sampling. (default: 500)")
+    init_parser.add_argument("--lease-seconds", type=float, default=3600, help="Seconds before an unrenewed lease returns to the pool. (default: 3600)")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve the leases of a run over HTTP")
+    serve_parser.add_argument("--db", type=str, default=COORDINATOR_FILENAME, help=f"Coordinator SQLite file. (default: {COORDINATOR_FILENAME})")
+    serve_parser.add_argument("--host", type=str, default="0.0.0.0", help="Address to listen on. (default: 0.0.0.0)")
+    serve_parser.add_argument("--port", type=int, default=8765, help="Port to listen on. (default: 8765)")
+
+    status_parser = subparsers.add_parser("status", help="Show the progress of a run")
+    status_parser.add_argument("--coordinator", type=str, default=COORDINATOR_FILENAME, help=f"Coordinator SQLite file or URL. (default: {COORDINATOR_FILENAME})")
+
+    merge_parser = subparsers.add_parser("merge", help="Merge the host directories of a run into one output")
+    merge_parser.add_argument("run_dir", type=str, help="Run directory holding one subdirectory per host, e.g. measurements/2025-01-01_10-00-00")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "init":
+        end_rank = args.end_rank
+        if end_rank is None:
+            end_rank = max((rank for rank, _ in read_tranco_csv(args.input)), default=0)
+        store = LeaseStore(args.db)
+        store.create_run(args.run_id, args.start_rank, end_rank, args.lease_size, args.lease_seconds)
+        print(json.dumps(dict(store.info(), **store.status()), indent=2))
+    elif args.command == "serve":
+        serve(LeaseStore(args.db), host=args.host, port=args.port)
+    elif args.command == "status":
+        print(json.dumps(connect_coordinator(args.coordinator).status(), indent=2))
+    else:
+        merge_host_runs(args.run_dir)
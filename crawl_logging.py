@@ -1,14 +1,115 @@
+import json
 import logging
+import contextvars
+import multiprocessing
 from datetime import datetime
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
 
 
-def start_logging(log_filename):
+# Context fields attached to every log record
+CONTEXT_FIELDS = ("website_id", "worker", "phase")
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Fields of the whole process (worker id), overridden per thread by log_context()
+process_context = {}
+current_context = contextvars.ContextVar("log_context", default={})
+
+log_queue = None
+listener = None
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Attach fields (website_id, phase) to all records logged by this thread inside the block.
+    """
+    token = current_context.set(dict(current_context.get(), **fields))
+    try:
+        yield
+    finally:
+        current_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        context = current_context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field, process_context.get(field)))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, process, message and the context fields that are set.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def attach_queue_handler(queue, verbose=False):
+    """
+    Route all records of this process into the log queue. Debug records are dropped
+    before they are queued unless verbose.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = QueueHandler(queue)
+    handler.addFilter(ContextFilter())
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG if verbose else logging.INFO)
+
+
+def start_logging(log_filename, log_format="json", verbose=False):
     """
     Log the current date and time when logging is started.
+    Records are queued by the crawl threads and written to log_filename by a listener thread,
+    so file I/O never blocks a visit. Worker processes log into the same queue (get_log_queue).
     """
-    logging.basicConfig(
-        filename=log_filename,
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s"
-    )
+    global log_queue, listener
+    handler = logging.FileHandler(log_filename, encoding="utf-8")
+    handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    log_queue = multiprocessing.Queue(-1)
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    attach_queue_handler(log_queue, verbose)
     logging.info(f"Logging started at {datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+
+
+def get_log_queue():
+    return log_queue
+
+
+def start_worker_logging(queue, worker_id, verbose=False):
+    """
+    Logging of a crawl worker process: every record carries the worker id and goes to the parent's listener.
+    """
+    process_context["worker"] = worker_id
+    attach_queue_handler(queue, verbose)
+
+
+def stop_logging():
+    """
+    Write all queued records and stop the listener thread.
+    """
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
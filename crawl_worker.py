@@ -0,0 +1,388 @@
+import os
+import queue
+import logging
+import threading
+import traceback
+import multiprocessing
+
+from output_sinks import create_sink, merge_sink_partitions
+from utils import capture_browser_data, wait_for_page_load, wait_for_network_idle, current_time, take_page_screenshot
+from crawl_logging import start_worker_logging, get_log_queue, log_context
+from browser_session import BrowserSession
+from blob_store import BlobStore
+from streaming_capture import StreamingCapture, STREAMING_SELENIUMWIRE_OPTIONS
+from phase_metrics import PhaseTimer
+from retry_queue import classify_error
+from screenshot_pipeline import ScreenshotPipeline
+from capture_policy import CapturePolicy
+from resource_governor import ResourceGovernor, ConcurrencyThrottle, wait_until_allowed
+from websocket_capture import WebSocketCapture, merge_websocket_partitions
+from baseline import landing_fingerprint
+
+
+# Seconds a worker waits for its next website before committing held back output
+COMMIT_IDLE_SECONDS = 5
+
+def create_capture_policy(settings):
+    """
+    CapturePolicy of the run, settings only carry its JSON-serializable form.
+    """
+    return CapturePolicy(**(settings.get("capture_policy") or {}))
+
+
+def create_browser_session(settings, proxy_port=None, worker_id=0, capture=None, websockets=None):
+    """
+    Create the BrowserSession of a worker. Warm (reused) browsers get one profile directory per worker.
+    """
+    relaunch_every = settings["reuse_browser"] or 1
+    profile_path = os.path.join(settings["browser_profile_path"], f"worker_{worker_id}") if relaunch_every > 1 else None
+    return BrowserSession(settings["browser"], headless=settings["headless"], proxy_port=proxy_port,
+                          relaunch_every=relaunch_every, profile_path=profile_path,
+                          capture=capture, websockets=websockets, seleniumwire_overrides=STREAMING_SELENIUMWIRE_OPTIONS if capture else None,
+                          capture_policy=capture.capture_policy if capture else create_capture_policy(settings))
+
+
+def create_capture(settings, sink, blob_store=None):
+    """
+    StreamingCapture for --capture-mode stream, None for the default end-of-visit capture.
+    """
+    if settings["capture_mode"] != "stream":
+        return None
+    return StreamingCapture(sink, blob_store=blob_store, capture_policy=create_capture_policy(settings))
+
+
+def create_blob_store(settings):
+    """
+    Shared response body store of the run, or None when bodies are stored inline.
+    """
+    if not settings["body_store"]:
+        return None
+    return BlobStore(os.path.join(settings["base_path"], "response_bodies"))
+
+
+def create_screenshot_pipeline(settings):
+    """
+    Background screenshot encoder and writer of a crawl process.
+    """
+    return ScreenshotPipeline(settings["base_path"], image_format=settings["screenshot_format"], max_width=settings["screenshot_max_width"],
+                              dedup_distance=settings["screenshot_dedup_distance"], threads=settings["screenshot_threads"])
+
+
+def create_websocket_capture(settings, partition=None):
+    """
+    Writer of the WebSocket message stream of a crawl process, or None if WebSocket capture is off.
+    """
+    if not settings["websocket_capture"]:
+        return None
+    return WebSocketCapture(settings["base_path"], partition=partition, max_messages=settings["websocket_max_messages"],
+                            max_bytes=settings["websocket_max_bytes"], sample_rate=settings["websocket_sample_rate"],
+                            hash_payloads=settings["websocket_hash_payloads"])
+
+
+def create_resource_governor(settings, session):
+    """
+    Started ResourceGovernor sampling the browser session of a crawl process.
+    """
+    return ResourceGovernor(session, interval=settings["governor_interval"], rss_budget_mb=settings["browser_memory_budget"]).start()
+
+
+def unpack_site(site):
+    """
+    (website_id, domain, probe) of a site tuple; probe is None unless the connectivity prefilter checked the website.
+    """
+    website_id, domain, *rest = site
+    return website_id, domain, rest[0] if rest else None
+
+
+def visit_website(website_id, domain, settings, sink, session, blob_store=None, screenshots=None, probe=None, websockets=None):
+    """
+    Visit a single website: start (or reset) browser - load page - screenshot - scroll - store web requests - close browser.
+    With a connectivity probe, its landing URL is visited, or the visit fails without a browser if the website is unreachable.
+    Returns the visit result: {"website_id", "domain", "visited" (page load attempted), "success", "error", "error_class", "requests", "phases"},
+    plus "fingerprint" (landing_fingerprint) of a crawled website and "prefiltered" when the
+    connectivity probe failed the website.
+    """
+    result = {"website_id": website_id, "domain": domain, "visited": False, "success": False, "error": None, "error_class": None, "requests": 0}
+    timer = PhaseTimer()
+    result["phases"] = timer.durations
+
+    if probe is not None and probe["error_class"]:
+        result["error"], result["error_class"] = probe["error"], probe["error_class"]
+        result["prefiltered"] = True
+        logging.warning(f"Website #{website_id} ({domain}) unreachable, failed without a browser: {probe['error']}")
+        return result
+
+    # In case of stateless mode, this could be used to store browser profiles as well for some browsers like chrome
+    website_screenshot_path = os.path.join(settings["base_path"], "website_screenshots", domain)
+    os.makedirs(website_screenshot_path, exist_ok=True)
+
+    website_url = (probe or {}).get("landing_url") or "https://" + domain
+
+    try:
+        # Setup browser instance (fresh or warm with wiped state)
+        with timer.phase("setup_webdriver"):
+            driver = session.acquire(browser_profile_path=website_screenshot_path)
+        logging.info(f"Website #{website_id}")
+        logging.info(f"Visiting website URL:\t {website_url}")
+        if session.capture is not None:
+            session.capture.start_site(current_time(), website_id, website_url)
+        if websockets is not None:
+            websockets.start_site(current_time(), website_id, website_url)
+
+        # Visiting Website, failures are retried later by the RetryScheduler
+        with timer.phase("driver_get"):
+            result["visited"] = True
+            driver.get(website_url)
+
+        with timer.phase("wait_for_page_load"):
+            wait_for_page_load(driver, timeout=30)
+
+        # Take screenshot of the page, encoding and writing happen in the background
+        with timer.phase("screenshot"):
+            if screenshots is not None:
+                screenshots.submit(website_id, domain, driver.get_screenshot_as_png())
+            else:
+                take_page_screenshot(driver, f"{website_screenshot_path}/{website_url}.png")
+
+        # Scroll
+        with timer.phase("scroll"):
+            driver.execute_script("window.scrollBy(0, 300);")
+
+        # Wait until the page stops issuing requests before capturing them
+        with timer.phase("settle"):
+            wait_for_network_idle(driver, idle_window=settings["settle_idle"], min_wait=settings["settle_min"], max_wait=settings["settle_max"],
+                                  activity=session.activity.activity_state)
+        if websockets is not None:
+            with timer.phase("websockets"):
+                websockets.finish_site()
+        logging.debug(f"Storing web requests for website: \t {website_url} ")
+        if session.capture is not None:
+            # Records were built while the page loaded, only write them
+            with timer.phase("store"):
+                records = session.capture.finish_site(driver)
+        else:
+            with timer.phase("capture"):
+                data = capture_browser_data(driver, blob_store=blob_store, capture_policy=session.capture_policy)
+            records = data['web_requests']
+            with timer.phase("store"):
+                sink.write_site(current_time(), website_id, website_url, records)
+        result["requests"] = len(records)
+        # Journaled, so the run can be the baseline of an incremental re-crawl
+        result["fingerprint"] = landing_fingerprint(website_url, records)
+
+        # Close the browser, unless it is kept warm for the next website
+        with timer.phase("close_browser"):
+            session.release()
+
+        result["success"] = True
+        logging.info(f"... Website #{website_id} DONE ...\n\n\n")
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {str(e).strip().splitlines()[0] if str(e).strip() else ''}"
+        result["error_class"] = classify_error(type(e).__name__, str(e))
+        logging.error(f"[ERROR] Exception while setting up WebDriver or browsing ({result['error_class']}):\n{e}")
+        # Always relaunch after an error, a warm browser may be in a broken state
+        try:
+            if session.capture is not None:
+                session.capture.finish_site(succeeded=False)
+            if websockets is not None:
+                websockets.finish_site(succeeded=False)
+            with timer.phase("close_browser"):
+                session.close()
+        except Exception as err:
+            logging.warning(f"Failure while Browser cleanup: {err}")
+        traceback.print_exc()
+
+    return result
+
+
+def report_committed(sink, results, report, force=False):
+    """
+    Report the results of successful visits once the sink committed their output, so the journal
+    never marks a website done whose requests are not readable yet. Reported results are removed
+    from the results list.
+    """
+    if results and sink.commit(force=force):
+        for result in results:
+            report(result)
+        results.clear()
+
+
+def worker_main(worker_id, task_queue, result_queue, settings, proxy_port=None, allowed_workers=None, log_queue=None):
+    """
+    Worker process: pulls (website_id, domain[, probe]) tasks until it receives None and
+    writes into its own output partition. Pauses while allowed_workers (shared value) is not above its worker_id.
+    Reports (worker_id, "task", task) for every task it takes, (worker_id, "result", result) and finally
+    (worker_id, "exit", None) on result_queue. Log records go through log_queue to the parent's log file.
+    """
+    if log_queue is not None:
+        start_worker_logging(log_queue, worker_id, verbose=settings["log_verbose"])
+    logging.getLogger('seleniumwire').setLevel(logging.ERROR)
+
+    sink = create_sink(settings["output_format"], settings["base_path"], partition=worker_id, batch_size=settings["output_batch_size"])
+    blob_store = create_blob_store(settings)
+    capture = create_capture(settings, sink, blob_store=blob_store)
+    websockets = create_websocket_capture(settings, partition=worker_id)
+    session = create_browser_session(settings, proxy_port=proxy_port, worker_id=worker_id, capture=capture, websockets=websockets)
+    screenshots = create_screenshot_pipeline(settings)
+    governor = create_resource_governor(settings, session)
+    logging.info(f"Worker {worker_id} started (proxy port: {proxy_port or 'auto'}, output: {sink.path})")
+
+    def report(result):
+        result["output_bytes"] = sink.bytes_written()
+        result_queue.put((worker_id, "result", result))
+
+    uncommitted = []
+    try:
+        while True:
+            wait_until_allowed(worker_id, allowed_workers, session,
+                               before_pause=lambda: report_committed(sink, uncommitted, report, force=True))
+            try:
+                task = task_queue.get(timeout=COMMIT_IDLE_SECONDS) if uncommitted else task_queue.get()
+            except queue.Empty:
+                # The retry scheduler may be waiting for these results before it hands out more work
+                report_committed(sink, uncommitted, report, force=True)
+                task = task_queue.get()
+            # The parent tracks the websites each worker holds, in case the worker dies
+            result_queue.put((worker_id, "task", task))
+            if task is None:
+                break
+            website_id, domain, probe = unpack_site(task)
+            with log_context(website_id=website_id):
+                result = visit_website(website_id, domain, settings, sink, session, blob_store=blob_store, screenshots=screenshots, probe=probe,
+                                       websockets=websockets)
+            result["worker"] = worker_id
+            result["resources"] = governor.visit_stats()
+            if result["success"]:
+                uncommitted.append(result)
+            else:
+                report(result)
+            report_committed(sink, uncommitted, report)
+    except KeyboardInterrupt:
+        logging.warning(f"Keyboard Interrupt detected. Stopping worker {worker_id}.")
+    finally:
+        governor.stop()
+        try:
+            session.close()
+        except Exception as e:
+            logging.warning(f"Failure while Browser cleanup: {e}")
+        screenshots.close()
+        if websockets is not None:
+            websockets.close()
+        report_committed(sink, uncommitted, report, force=True)
+        sink.close()
+        # Exit marker, so the parent does not wait for this worker anymore
+        result_queue.put((worker_id, "exit", None))
+        logging.info(f"Worker {worker_id} finished.")
+
+
+def crashed_worker_result(site, worker_id, exitcode):
+    """
+    Failed visit result of a website whose worker process died before reporting it.
+    """
+    website_id, domain, _ = unpack_site(site)
+    return {"website_id": website_id, "domain": domain, "visited": True, "success": False,
+            "error": f"Worker {worker_id} died (exit code {exitcode})", "error_class": "driver_crash",
+            "requests": 0, "phases": {}, "worker": worker_id}
+
+
+def run_worker_pool(sites, settings, num_workers, on_result=None, proxy_base_port=None):
+    """
+    Crawl sites with num_workers independent browser sessions fed from a shared work queue.
+    on_result(result) is called in the parent process for every finished site.
+    Fewer workers take new websites while host memory is under pressure.
+    The websites a worker took but did not report yet are tracked, so when a worker process dies
+    they fail as driver_crash (and are retried) and the worker is started again.
+    """
+    task_queue = multiprocessing.Queue(maxsize=num_workers * 2)
+    result_queue = multiprocessing.Queue()
+    allowed_workers = multiprocessing.Value('i', num_workers)
+    throttle = ConcurrencyThrottle(allowed_workers, num_workers, high_watermark=settings["memory_high_watermark"],
+                                   low_watermark=settings["memory_low_watermark"], interval=settings["governor_interval"]).start()
+
+    def start_worker(worker_id):
+        proxy_port = proxy_base_port + worker_id if proxy_base_port else None
+        process = multiprocessing.Process(
+            target=worker_main,
+            args=(worker_id, task_queue, result_queue, settings, proxy_port, allowed_workers, get_log_queue()),
+            name=f"crawl-worker-{worker_id}",
+        )
+        process.start()
+        return process
+
+    workers = [start_worker(worker_id) for worker_id in range(num_workers)]
+
+    def feed_tasks():
+        for site in sites:
+            task_queue.put(site)
+        # Paused workers must run again to receive their exit marker
+        throttle.stop()
+        for _ in range(num_workers):
+            task_queue.put(None)
+
+    # Feeding from a thread keeps the task queue bounded for very long site lists
+    feeder = threading.Thread(target=feed_tasks, name="crawl-feeder", daemon=True)
+    feeder.start()
+
+    running = set(range(num_workers))
+    # Websites each worker took and has not reported yet, by website id
+    in_progress = {worker_id: {} for worker_id in range(num_workers)}
+    stopping = set()
+
+    def handle(message):
+        worker_id, kind, payload = message
+        if kind == "task":
+            if payload is None:
+                stopping.add(worker_id)
+            else:
+                in_progress[worker_id][payload[0]] = payload
+        elif kind == "result":
+            in_progress[worker_id].pop(payload["website_id"], None)
+            if on_result:
+                on_result(payload)
+        else:
+            running.discard(worker_id)
+
+    def recover(worker_id):
+        # Messages the worker sent before it died are still queued
+        while True:
+            try:
+                handle(result_queue.get_nowait())
+            except queue.Empty:
+                break
+        if worker_id not in running:
+            return
+        process = workers[worker_id]
+        lost = list(in_progress[worker_id].values())
+        in_progress[worker_id] = {}
+        logging.error(f"Worker {worker_id} died (exit code {process.exitcode}) with {len(lost)} websites in progress")
+        for site in lost:
+            if on_result:
+                on_result(crashed_worker_result(site, worker_id, process.exitcode))
+        # A worker that dies without a website in hand (e.g. at startup) would die again
+        if worker_id in stopping or not lost:
+            running.discard(worker_id)
+            return
+        logging.info(f"Restarting worker {worker_id}")
+        workers[worker_id] = start_worker(worker_id)
+
+    try:
+        while running:
+            try:
+                handle(result_queue.get(timeout=5))
+            except queue.Empty:
+                pass
+            for worker_id in list(running):
+                if not workers[worker_id].is_alive():
+                    recover(worker_id)
+        if feeder.is_alive():
+            logging.error("All crawl workers exited before the crawl finished.")
+    finally:
+        throttle.stop()
+        for process in workers:
+            process.join(timeout=60)
+            if process.is_alive():
+                logging.warning(f"Worker {process.name} did not exit in time, terminating.")
+                process.terminate()
+        merge_sink_partitions(settings["output_format"], settings["base_path"], range(num_workers))
+        if settings["websocket_capture"]:
+            merge_websocket_partitions(settings["base_path"], range(num_workers))
@@ -0,0 +1,54 @@
+import os
+import gzip
+import json
+import logging
+import argparse
+import multiprocessing
+from collections import Counter
+
+from id_extraction import IdExtractor
+from output_readers import iter_raw_chunks, decode_chunk
+
+
+IDS_FILENAME = "extracted_ids.jsonl.gz"
+
+
+def extract_ids_from_chunk(chunk):
+    """
+    Worker: decode a raw output chunk and return (JSON lines of requests carrying IDs, Counter of ID types).
+    """
+    extractor = IdExtractor()
+    lines = []
+    counts = Counter()
+    for record in decode_chunk(chunk):
+        ids = extractor.extract(record.get("url") or "")
+        if ids:
+            counts.update({id_name: len(values) for id_name, values in ids.items()})
+            lines.append(json.dumps({"website_id": record.get("website_id"), "url": record.get("url"), "extracted_ids": ids}) + "\n")
+    return lines, counts
+
+
+def extract_ids_from_run(run_dir, workers=None, output_format=None):
+    """
+    Run the extractor over a finished measurement run on all cores and write
+    extracted_ids.jsonl.gz into the run directory. Returns the Counter of ID types.
+    """
+    output_path = os.path.join(run_dir, IDS_FILENAME)
+    counts = Counter()
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool, gzip.open(output_path, 'wt', encoding='utf-8') as out:
+        for lines, chunk_counts in pool.imap(extract_ids_from_chunk, iter_raw_chunks(run_dir, output_format)):
+            out.writelines(lines)
+            counts.update(chunk_counts)
+    logging.info(f"Extracted IDs written to {output_path}: {dict(counts)}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract tracker IDs from the requests of a finished measurement run")
+    parser.add_argument("run_dir", type=str, help="Measurement directory, e.g. measurements/2025-01-01_10-00-00")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. (default: all cores)")
+    parser.add_argument("--output-format", choices=["csv", "jsonl", "parquet"], default=None, help="Output format of the run. (default: detected)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    extract_ids_from_run(args.run_dir, workers=args.workers, output_format=args.output_format)
@@ -0,0 +1,180 @@
+import os
+import json
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qsl
+
+from output_readers import iter_raw_chunks, decode_chunk
+
+
+HAR_DIRNAME = "har"
+HAR_VERSION = "1.2"
+HAR_CREATOR = {"name": "website-measurement-crawler", "version": "1.0"}
+
+
+def har_datetime(timestamp):
+    """
+    ISO 8601 with the local UTC offset, as HAR requires; the crawler records naive local times.
+    """
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp).astimezone().isoformat()
+    except ValueError:
+        return timestamp
+
+
+def har_headers(headers):
+    return [{"name": name, "value": str(value)} for name, value in (headers or {}).items()]
+
+
+def header_value(headers, name):
+    for key, value in (headers or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def har_entry(record, pageref):
+    """
+    HAR entry of one request record. selenium-wire does not expose connection phases or the
+    first response byte, so the whole request duration is reported as wait time.
+    """
+    duration = record.get("duration_ms")
+    status_code = record.get("status_code")
+    response_headers = record.get("response_headers")
+    body_size = record.get("response_body_size")
+    content = {"size": body_size or 0, "mimeType": header_value(response_headers, "content-type") or ""}
+    if record.get("response_body"):
+        content["text"] = record["response_body"]
+    entry = {
+        "pageref": pageref,
+        "startedDateTime": har_datetime(record.get("timestamp")),
+        "time": duration if duration is not None else 0,
+        "request": {
+            "method": record.get("method") or "",
+            "url": record.get("url") or "",
+            "httpVersion": "",
+            "cookies": [],
+            "headers": har_headers(record.get("request_headers")),
+            "queryString": [{"name": name, "value": value} for name, value in parse_qsl(urlsplit(record.get("url") or "").query, keep_blank_values=True)],
+            "headersSize": -1,
+            "bodySize": record["request_body_size"] if record.get("request_body_size") is not None else -1,
+        },
+        "response": {
+            "status": status_code or 0,
+            "statusText": "",
+            "httpVersion": "",
+            "cookies": [],
+            "headers": har_headers(response_headers),
+            "content": content,
+            "redirectURL": record.get("location_header") or "",
+            "headersSize": -1,
+            "bodySize": body_size if body_size is not None else -1,
+        },
+        "cache": {},
+        "timings": {"blocked": -1, "dns": -1, "connect": -1, "ssl": -1, "send": 0, "wait": duration or 0, "receive": 0},
+    }
+    if record.get("response_body_sha256"):
+        entry["_responseBodySha256"] = record["response_body_sha256"]
+    if status_code is None:
+        entry["_error"] = "no response"
+    return entry
+
+
+class HarWriter:
+    """
+    Writes the HAR 1.2 file of one website visit entry by entry, so a visit's requests
+    are never held in memory together.
+    """
+
+    def __init__(self, path, website_id, website_url, visit_timestamp):
+        self.path = path
+        self.pageref = f"page_{website_id}"
+        self.entries = 0
+        self.file = open(path, 'w', encoding='utf-8')
+        page = {
+            "startedDateTime": har_datetime(visit_timestamp),
+            "id": self.pageref,
+            "title": website_url,
+            "pageTimings": {"onContentLoad": -1, "onLoad": -1},
+        }
+        log = json.dumps({"version": HAR_VERSION, "creator": HAR_CREATOR, "pages": [page]})
+        # Open the log object and its entries array, close() finishes both
+        self.file.write('{"log": ' + log[:-1] + ', "entries": [\n')
+
+    def add(self, record):
+        if self.entries:
+            self.file.write(",\n")
+        self.file.write(json.dumps(har_entry(record, self.pageref)))
+        self.entries += 1
+
+    def close(self):
+        self.file.write("\n]}}\n")
+        self.file.close()
+
+
+def har_chunk(chunk):
+    """
+    Records of a raw output chunk, decoded in a worker process and grouped by visit:
+    [((website_id, visit_timestamp), website_url, [records])] in output order.
+    """
+    visits = []
+    for record in decode_chunk(chunk):
+        key = (record["website_id"], record["visit_timestamp"])
+        if not visits or visits[-1][0] != key:
+            visits.append((key, record["website_url"], []))
+        visits[-1][2].append(record)
+    return visits
+
+
+def export_run(run_dir, output_dir=None, website_ids=None, workers=None, output_format=None):
+    """
+    Write one HAR file per website visit of a finished run to <run_dir>/har/<website_id>.har
+    (further visits of the same website, e.g. retries, get a -<n> suffix).
+    The outputs keep the requests of a visit together, so only the visit being exported is open.
+    Returns the number of HAR files written.
+    """
+    output_dir = output_dir or os.path.join(run_dir, HAR_DIRNAME)
+    os.makedirs(output_dir, exist_ok=True)
+    website_ids = set(website_ids) if website_ids else None
+    visit_counts = {}
+    writer, current = None, None
+    written = 0
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+        try:
+            for visits in pool.imap(har_chunk, iter_raw_chunks(run_dir, output_format)):
+                for key, website_url, records in visits:
+                    website_id = key[0]
+                    if website_ids is not None and website_id not in website_ids:
+                        continue
+                    if key != current:
+                        if writer is not None:
+                            writer.close()
+                        visit_counts[website_id] = visit_counts.get(website_id, 0) + 1
+                        suffix = f"-{visit_counts[website_id]}" if visit_counts[website_id] > 1 else ""
+                        writer = HarWriter(os.path.join(output_dir, f"{website_id}{suffix}.har"), website_id, website_url, key[1])
+                        current = key
+                        written += 1
+                    for record in records:
+                        writer.add(record)
+        finally:
+            if writer is not None:
+                writer.close()
+    logging.info(f"{written} HAR files written to {output_dir}")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the captured requests of a finished measurement run as HAR 1.2 files, one per website visit")
+    parser.add_argument("run_dir", type=str, help="Measurement directory, e.g. measurements/2025-01-01_10-00-00")
+    parser.add_argument("--website-id", type=int, nargs="+", default=None, help="Only export these websites (Tranco ranks). (default: all)")
+    parser.add_argument("--output-dir", type=str, default=None, help=f"Directory of the HAR files. (default: <run_dir>/{HAR_DIRNAME})")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes decoding the output. (default: all cores)")
+    parser.add_argument("--output-format", choices=["csv", "jsonl", "parquet"], default=None, help="Output format of the run. (default: detected)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    export_run(args.run_dir, output_dir=args.output_dir, website_ids=args.website_id, workers=args.workers, output_format=args.output_format)
@@ -1,21 +1,26 @@
-from selenium.common.exceptions import TimeoutException
-
 import os
-import time
-import json
+import re
+import socket
 import argparse
 import logging
 import platform
-import traceback
 from datetime import datetime
 
 
-from csv_storage import initialize_csv, store_data_in_csv
-from utils import capture_browser_data, wait_for_page_load, extract_domain, current_time, take_page_screenshot, take_element_screenshot
-from crawl_logging import start_logging
-from config import summary_data
-from setup_webdriver import setup_webdriver, close_browser
-from cert_installation import install_cert_windows, remove_cert_windows, install_cert_linux, remove_cert_linux
+from output_sinks import create_sink, OUTPUT_FILES
+from progress_journal import ProgressJournal, JOURNAL_FILENAME
+from phase_metrics import PhaseMetrics, METRICS_FILENAME
+from retry_queue import RetryScheduler
+from capture_policy import CapturePolicy, MEDIA_CONTENT_TYPES
+from coordinator import connect_coordinator, LeasedSites
+from crawl_logging import start_logging, stop_logging, log_context
+from baseline import IncrementalPlan
+from prefilter import ConnectivityPrefilter
+from metrics_registry import CrawlMetrics, MetricsExporter, PROMETHEUS_FILENAME
+from tranco_input import iter_tranco_sites, describe_selection, parse_shard
+from crawl_worker import visit_website, run_worker_pool, create_browser_session, create_blob_store, create_capture, create_screenshot_pipeline, unpack_site, \
+    create_resource_governor, create_websocket_capture, report_committed
+from cert_installation import install_cert_windows, remove_cert_windows, acquire_cert_linux, release_cert_linux
 
 # TODO: Bannerclick
 # from updated_bannerclick.bannerclick.bannerdetection import init as bannerclick_init, run_all_for_domain
@@ -23,100 +28,161 @@ from cert_installation import install_cert_windows, remove_cert_windows, install
 
 current_os = platform.system().lower()
 
-def setup_measurement_directory():
+def setup_measurement_directory(resume_dir=None, run_id=None, host_id=None):
     """
-    Create a new directory structure for storing measurement data.
+    Create a new directory structure for storing measurement data,
+    or reuse the directory of an interrupted run when resuming.
+    Hosts of a coordinated run (run_id from the coordinator) write to measurements/<run_id>/<host_id>.
     """
-    run_id = f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
-    
-    os.makedirs("measurements", exist_ok=True)
-    
-    base_path = os.path.join("measurements", f"{run_id}")
-    os.makedirs(base_path, exist_ok=True)
+    if resume_dir:
+        if not os.path.isdir(resume_dir):
+            raise FileNotFoundError(f"Measurement directory to resume not found: {resume_dir}")
+        base_path = os.path.normpath(resume_dir)
+        run_id = os.path.basename(base_path)
+    elif run_id:
+        base_path = os.path.join("measurements", run_id, host_id)
+        os.makedirs(base_path, exist_ok=True)
+    else:
+        run_id = f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+        
+        os.makedirs("measurements", exist_ok=True)
+        
+        base_path = os.path.join("measurements", f"{run_id}")
+        os.makedirs(base_path, exist_ok=True)
 
 
     session_csv_path = os.path.join(base_path, "session.csv")
     summary_txt_path = os.path.join(base_path, "summary.txt")
     logfile_path = os.path.join(base_path, "logfile.log")
     browser_profile_path = os.path.join(base_path, "browser_profile")
+    journal_path = os.path.join(base_path, JOURNAL_FILENAME)
 
-    return run_id, base_path, session_csv_path, summary_txt_path, logfile_path, browser_profile_path
+    return run_id, base_path, session_csv_path, summary_txt_path, logfile_path, browser_profile_path, journal_path
 
 
-def write_summary(summary_txt_path, summary_data):
+def write_summary(summary_txt_path, run_info, crawl_metrics=None, metrics=None):
     """
     Write measurement summary details to a text file.
+    crawl_metrics (CrawlMetrics) adds the counters of the run,
+    metrics (PhaseMetrics) adds throughput and per-phase timing percentiles.
     """
-    excluded_keys = ['Measurement Start Time', 'Measurement End Time', 'Country', 'Browser', 'Headless mode', 'Hourly Checkpoints']
     with open(summary_txt_path, 'w') as f:
         f.write("Crawler Measurement Summary\n\n")
-        f.write(f"Measurement Start Time: {summary_data['Measurement Start Time']}\n")
-        f.write(f"Country: {summary_data['Country']}\n")
-        f.write(f"Browser: {summary_data['Browser']}\n")
-        f.write(f"Headless Mode: {summary_data['Headless mode']}\n")
-        f.write(f"Measurement End Time: {summary_data['Measurement End Time']}\n\n")
+        f.write(f"Measurement Start Time: {run_info['Measurement Start Time']}\n")
+        f.write(f"Country: {run_info['Country']}\n")
+        f.write(f"Browser: {run_info['Browser']}\n")
+        f.write(f"Headless Mode: {run_info['Headless mode']}\n")
+        f.write(f"Measurement End Time: {run_info['Measurement End Time']}\n\n")
+        f.write(f"Input Selection: {run_info['Input Selection']}\n")
+        
+        if crawl_metrics is not None:
+            f.write(f"Number of websites visited: {int(crawl_metrics.visited.total())}\n")
+            f.write(f"Websites skipped (already completed): {int(crawl_metrics.skipped.total())}\n")
+            f.write(f"Websites unchanged since baseline: {int(crawl_metrics.unchanged.total())}\n")
+            f.write(f"Failed websites by error class: {crawl_metrics.failures.by_label('error_class')}\n")
+            f.write(f"Requests captured: {int(crawl_metrics.requests.total())}\n")
+            f.write(f"Output bytes: {int(crawl_metrics.output_bytes.total())}\n")
         
-        for key, value in summary_data.items():
-            if key not in excluded_keys:
-                f.write(f"{key}: {value}\n")
+        if metrics is not None:
+            f.write(f"Sites per hour: {metrics.sites_per_hour()}\n")
+            f.write("\nPhase Timings:\n")
+            for phase, timing in metrics.phase_summary().items():
+                f.write(f"- {phase}: {timing}\n")
+            f.write("\nPeak Resources:\n")
+            for resource, value in metrics.resource_summary().items():
+                f.write(f"- {resource}: {value}\n")
                 
         f.write("\nHourly Checkpoints:\n")
-        for checkpoint in summary_data["Hourly Checkpoints"]:
+        for checkpoint in run_info["Hourly Checkpoints"]:
             f.write(f"- {checkpoint}\n")
             
             
-def check_point(summary_txt_path, ytMaxResults):
-    start_time = datetime.strptime(summary_data["Measurement Start Time"], '%Y-%m-%d %H:%M:%S')
+def check_point(summary_txt_path, run_info, crawl_metrics, metrics=None):
+    start_time = datetime.strptime(run_info["Measurement Start Time"], '%Y-%m-%d %H:%M:%S')
 
     current_time = datetime.now()
     elapsed_time = current_time - start_time
 
-    # Checkpoint every hour
-    if elapsed_time.total_seconds() >= (len(summary_data["Hourly Checkpoints"]) + 1) * 3600:
-        checkpoint = f"Hour {len(summary_data['Hourly Checkpoints']) + 1}: {summary_data['Number of websites visited']} out of {ytMaxResults} videos watched at {current_time.strftime('%Y-%m-%d %H:%M:%S')}"
-        summary_data["Hourly Checkpoints"].append(checkpoint)
-        write_summary(summary_txt_path, summary_data)
+    # Checkpoint every hour, live numbers are exported continuously by the MetricsExporter
+    if elapsed_time.total_seconds() >= (len(run_info["Hourly Checkpoints"]) + 1) * 3600:
+        checkpoint = f"Hour {len(run_info['Hourly Checkpoints']) + 1}: {int(crawl_metrics.visited.total())} websites visited at {current_time.strftime('%Y-%m-%d %H:%M:%S')}"
+        run_info["Hourly Checkpoints"].append(checkpoint)
+        write_summary(summary_txt_path, run_info, crawl_metrics, metrics)
         
         
-def main(browser, country, headless):
+def main(browser, country, headless, workers=1, proxy_base_port=None, settle_idle=5, settle_min=2, settle_max=30, reuse_browser=0,
+         tranco_csv_path=os.path.join("crawling_csv", "tranco_list.csv"), start_rank=None, end_rank=None, shard=None,
+         bucket_size=None, per_bucket=None, sample_seed=0, output_format="csv", output_batch_size=1000,
+         body_store=False, body_skip_mime=None, max_body_size=None, capture_mode="batch", resume_dir=None,
+         max_attempts=3, retry_base_delay=60, screenshot_format="png", screenshot_max_width=None,
+         screenshot_dedup_distance=0, screenshot_threads=2, capture_policy=None, coordinator=None, host_id=None,
+         browser_memory_budget=None, memory_high_watermark=85, memory_low_watermark=70, governor_interval=5,
+         log_format="json", log_verbose=False, metrics_export=True, metrics_port=None, metrics_interval=15,
+         baseline_dir=None, changed_only=False, probe_workers=16, prefilter=False, prefilter_concurrency=64, prefilter_timeout=15,
+         websocket_capture=False, websocket_max_messages=200, websocket_max_bytes=256 * 1024, websocket_sample_rate=1.0,
+         websocket_hash_payloads=False):
     """
-    Main function which starts the browser - visits youtube videos - perform measurements - closes browser
+    Main function which starts the browsers - visits the selected websites - records their requests - closes the browsers
     """
     global current_os
+    if output_format not in OUTPUT_FILES:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if capture_mode not in ("batch", "stream"):
+        raise ValueError(f"Unknown capture mode: {capture_mode}")
+    # --body-skip-mime and --max-body-size set the body filters of the capture policy
+    capture_policy = capture_policy or CapturePolicy()
+    if body_skip_mime is not None:
+        capture_policy = capture_policy.updated(body_skip_content_types=body_skip_mime)
+    elif body_store and not capture_policy.policy["body_skip_content_types"]:
+        capture_policy = capture_policy.updated(body_skip_content_types=MEDIA_CONTENT_TYPES)
+    if max_body_size is not None:
+        capture_policy = capture_policy.updated(max_body_size=max_body_size)
+    # Hosts of a coordinated run lease their rank ranges and share the coordinator's run id
+    lease_client = connect_coordinator(coordinator) if coordinator else None
+    coordinated_run_id = lease_client.info()["run_id"] if lease_client else None
+    
     # 1. Setup measurement directory
-    run_id, base_path, session_csv_path, summary_txt_path, logfile_path, browser_profile_path = setup_measurement_directory() 
+    run_id, base_path, session_csv_path, summary_txt_path, logfile_path, browser_profile_path, journal_path = setup_measurement_directory(
+        resume_dir, run_id=coordinated_run_id, host_id=host_id)
     
-    # Initialize summary data
-    summary_data["Measurement Start Time"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    summary_data["Measurement End Time"] = None
-    summary_data["Number of websites visited"] = 0
-    summary_data["Country"] = country
-    summary_data["Browser"] = browser
-    summary_data["Headless mode"] = "Enabled" if headless else "Disabled"
-    summary_data["Hourly Checkpoints"] = []
+    # Description of the run for the summary, counters live in crawl_metrics
+    run_info = {
+        "Measurement Start Time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "Measurement End Time": None,
+        "Country": country,
+        "Browser": browser,
+        "Headless mode": "Enabled" if headless else "Disabled",
+        "Input Selection": None,
+        "Hourly Checkpoints": [],
+    }
+    crawl_metrics = CrawlMetrics()
     
     # 2. Setup logging before further processing
-    start_logging(logfile_path)
+    start_logging(logfile_path, log_format=log_format, verbose=log_verbose)
     
     
-    # TODO: Video list to go through
-    # Get the combined videos for 3 days:
-    tranco_csv_path = os.path.join("crawling_csv", "tranco_list.csv")
-    domain_dict = {}
-
-    with open(tranco_csv_path, "r") as file:
-        for line in file:
-            key, value = line.strip().split(",")
-            domain_dict[int(key)] = value
-        
+    # Websites to go through, streamed from the Tranco list
+    selection = dict(start_rank=start_rank, end_rank=end_rank, shard=shard, bucket_size=bucket_size, per_bucket=per_bucket, seed=sample_seed)
+    sites = iter_tranco_sites(tranco_csv_path, **selection)
+    run_info["Input Selection"] = describe_selection(tranco_csv_path, **selection)
+    if lease_client:
+        run_info["Input Selection"] += f", ranks leased from {coordinator} (host {host_id})"
+    if baseline_dir:
+        run_info["Input Selection"] += f", incremental against {baseline_dir}" + (" (changed websites only)" if changed_only else "")
     
     # Installing MiTM Certificates
     if "windows" in current_os:
         install_cert_windows()
     else:
-        install_cert_linux(system_wide=os.geteuid() == 0, user_nss=True)
+        acquire_cert_linux(system_wide=os.geteuid() == 0, user_nss=True)
     
     
+    # Live metrics for operators, exported while the crawl runs
+    exporter = MetricsExporter(crawl_metrics.registry, textfile_path=os.path.join(base_path, PROMETHEUS_FILENAME) if metrics_export else None,
+                               port=metrics_port, interval=metrics_interval).start()
+    journal = None
+    leased_sites = None
+    metrics = PhaseMetrics(os.path.join(base_path, METRICS_FILENAME))
     try: 
         logging.info("Script started with the following command-line arguments:")
         logging.info(f"Country: {country}")
@@ -130,85 +196,132 @@ def main(browser, country, headless):
         # Or redirect selenium-wire logs to null (disable completely)
         # logging.getLogger('seleniumwire').propagate = False
             
-        # 1. Initialize csv
-        initialize_csv(session_csv_path)
-        logging.info(f"Length of Website list is: \t {len(domain_dict)}")
+        # Settings shared with every crawl worker
+        settings = {
+            "browser": browser,
+            "headless": headless,
+            "base_path": base_path,
+            "logfile_path": logfile_path,
+            "settle_idle": settle_idle,
+            "settle_min": settle_min,
+            "settle_max": settle_max,
+            "reuse_browser": reuse_browser,
+            "browser_profile_path": browser_profile_path,
+            "output_format": output_format,
+            "output_batch_size": output_batch_size,
+            "body_store": body_store,
+            "capture_mode": capture_mode,
+            "screenshot_format": screenshot_format,
+            "screenshot_max_width": screenshot_max_width,
+            "screenshot_dedup_distance": screenshot_dedup_distance,
+            "screenshot_threads": screenshot_threads,
+            "capture_policy": capture_policy.to_dict(),
+            "browser_memory_budget": browser_memory_budget,
+            "memory_high_watermark": memory_high_watermark,
+            "memory_low_watermark": memory_low_watermark,
+            "governor_interval": governor_interval,
+            "log_verbose": log_verbose,
+            "websocket_capture": websocket_capture,
+            "websocket_max_messages": websocket_max_messages,
+            "websocket_max_bytes": websocket_max_bytes,
+            "websocket_sample_rate": websocket_sample_rate,
+            "websocket_hash_payloads": websocket_hash_payloads,
+        }
+        logging.info(f"Website list: \t {run_info['Input Selection']}")
         
-        for i in range(0, len(domain_dict)):
-            website_id = list(domain_dict.keys())[i]
-            website_url = list(domain_dict.values())[i]
-            
-            # In case of stateless mode, this could be used to store browser profiles as well for some browsers like chrome
-            website_screenshot_path = os.path.join(base_path, "website_screenshots", website_url)
-            os.makedirs(website_screenshot_path, exist_ok=True)
-            
-            
-            website_url = "https://"+website_url
+        # Progress journal, skip websites an interrupted run already finished
+        journal = ProgressJournal(journal_path)
+        previous_settings = journal.save_settings(settings)
+        completed = set()
+        if resume_dir:
+            completed = journal.completed_sites()
+            logging.info(f"Resuming {base_path}: {len(completed)} websites already completed")
+            if previous_settings and previous_settings.get("output_format") != output_format:
+                logging.warning(f"Resumed run used --output-format {previous_settings.get('output_format')}, now {output_format}")
             
+            def skip_completed(sites):
+                for website_id, domain in sites:
+                    if website_id in completed:
+                        crawl_metrics.skipped.inc()
+                        continue
+                    yield website_id, domain
+            sites = skip_completed(sites)
+        if baseline_dir:
+            # Failed and missing websites of the baseline first, then (changed) completed ones
+            sites = IncrementalPlan(baseline_dir, lambda: iter_tranco_sites(tranco_csv_path, **selection), journal_path, crawl_metrics,
+                                    completed=completed, changed_only=changed_only, probe_workers=probe_workers)
+        if lease_client:
+            # A restarted host skips what it already finished of a lease it gets again
+            leased_sites = LeasedSites(lease_client, host_id,
+                                       lambda first, last: iter_tranco_sites(tranco_csv_path, **dict(selection, start_rank=first, end_rank=last)),
+                                       completed=journal.completed_sites())
+            sites = leased_sites
+        if prefilter:
+            # Dead websites fail without a browser, reachable ones are visited at their landing URL
+            sites = ConnectivityPrefilter(sites, concurrency=prefilter_concurrency, timeout=prefilter_timeout)
+        output_path = os.path.join(base_path, OUTPUT_FILES[output_format])
+        
+        # Failed websites are queued again with exponential backoff instead of blocking the crawl
+        scheduler = RetryScheduler(sites, max_attempts=max_attempts, base_delay=retry_base_delay)
+        sites = scheduler
+        
+        def on_result(result):
+            status = scheduler.record_result(result)
+            crawl_metrics.record(result, status)
+            if status == "retry":
+                status = "retry_pending"
+            journal.record_result(result["website_id"], result["domain"], status,
+                                  output=output_path if result["success"] else None,
+                                  error=result["error"], error_class=result["error_class"])
+            if result.get("fingerprint"):
+                journal.record_fingerprint(result["website_id"], result["domain"], result["fingerprint"])
+            if leased_sites is not None and status != "retry_pending":
+                leased_sites.record_final(result["website_id"], success=result["success"])
+            metrics.record(result)
+            check_point(summary_txt_path, run_info, crawl_metrics, metrics=metrics)
+        
+        if workers > 1:
+            logging.info(f"Crawling with {workers} parallel workers")
+            run_worker_pool(sites, settings, workers, on_result=on_result, proxy_base_port=proxy_base_port)
+        else:
+            # 1. Initialize output
+            sink = create_sink(output_format, base_path, batch_size=output_batch_size)
+            blob_store = create_blob_store(settings)
+            capture = create_capture(settings, sink, blob_store=blob_store)
+            websockets = create_websocket_capture(settings)
+            session = create_browser_session(settings, proxy_port=proxy_base_port, capture=capture, websockets=websockets)
+            screenshots = create_screenshot_pipeline(settings)
+            governor = create_resource_governor(settings, session)
+
+            def report(result):
+                result["output_bytes"] = sink.bytes_written()
+                on_result(result)
 
-            time.sleep(2)
+            # Successful visits are journaled once the sink committed their output. The scheduler
+            # waits for them at the end of the run, so it commits whatever is left first
+            uncommitted = []
+            scheduler.on_idle = lambda: report_committed(sink, uncommitted, report, force=True)
             try:
-                # 3. Setup browser instance
-                driver = setup_webdriver(browser, headless=headless, stateful=False, browser_profile_path=website_screenshot_path)
-                logging.info(f"Video #{i+1} of {len(domain_dict)}")
-                logging.info(f"Visiting website URL:\t {website_url}")
-                
-                # Sleeping 5 seconds
-                time.sleep(5)
-                
-                
-                # Visiting Website
-                try: 
-                    summary_data["Number of websites visited"] += 1  # Increment website count
-                    driver.get(website_url)
-                # TODO: Check if handles the HTTPConnectionPool error
-                except Exception as e:
-                    if "Read timed out" in str(e) or "HTTPConnectionPool" in str(e):
-                        logging.error(f"HTTPConnectionPool error detected: {e}")
-                        time.sleep(10)
-                    driver.get(website_url)  # Retry once
-                except TimeoutException:
-                    logging.error(f"Timeout occurred, for website with url : {website_url} retrying in 10 seconds...")
-                    time.sleep(10)
-                    driver.get(website_url)  # Retry once
-                           
-                           
-                wait_for_page_load(driver, timeout=30)
-                
-                # Take screenshot of the youtube page
-                take_page_screenshot(driver, f"{website_screenshot_path}/{website_url}.png")
-                
-                # Scroll
-                driver.execute_script("window.scrollBy(0, 300);")
-                
-                # TODO: checking hourly checkpoint function
-                check_point(summary_txt_path, len(domain_dict))
-                # TODO: Wait before capturing web requests:
-                time.sleep(30)
-                logging.info(f"Storing web requests for website: \t {website_url} ")
-                store_data_in_csv(timestamp=current_time(), website_id=website_id, website_url=website_url, driver=driver, output_csv_path=session_csv_path)
-                
-                time.sleep(10)    
-                # 16. close the browser
-                close_browser(driver, browser)
-                
-                logging.info(f"... Website #{i+1} of {len(domain_dict)} DONE ...\n\n\n")
-                
-                # Sleep after closing browser
-                time.sleep(30)
-            except Exception as e:
-                logging.error(f"[ERROR] Exception while setting up WebDriver or browsing:\n{e}")
-                if "Read timed out" in str(e) or "HTTPConnectionPool" in str(e):
-                    logging.error(f"HTTPConnectionPool error detected: {e}")
-                # TODO: This was cause of Zombie processes, deleting those    
-                try:
-                    if 'driver' in locals():
-                        close_browser(driver, browser)
-                except Exception as err:
-                    logging.warning(f"Failure while Browser cleanup: {err}")
-                traceback.print_exc()
-                time.sleep(30)
-                continue
+                for i, site in enumerate(sites):
+                    website_id, domain, probe = unpack_site(site)
+                    logging.info(f"Website #{i+1} (rank {website_id})")
+                    with log_context(website_id=website_id):
+                        result = visit_website(website_id, domain, settings, sink, session, blob_store=blob_store, screenshots=screenshots, probe=probe,
+                                               websockets=websockets)
+                    result["resources"] = governor.visit_stats()
+                    if result["success"]:
+                        uncommitted.append(result)
+                    else:
+                        report(result)
+                    report_committed(sink, uncommitted, report)
+            finally:
+                governor.stop()
+                session.close()
+                screenshots.close()
+                if websockets is not None:
+                    websockets.close()
+                report_committed(sink, uncommitted, report, force=True)
+                sink.close()
                     
     
     except KeyboardInterrupt:
@@ -221,17 +334,23 @@ def main(browser, country, headless):
             logging.error(f"An unexpected error occurred: {e}")
     
     finally:
-        summary_data["Measurement End Time"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        run_info["Measurement End Time"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        exporter.stop()
         
         # Remove MiTM Certificate
         if "windows" in current_os:
             remove_cert_windows()
         else:
-            remove_cert_linux(system_wide=os.geteuid() == 0, user_nss=True)
+            release_cert_linux(system_wide=os.geteuid() == 0, user_nss=True)
+        
         
+        if leased_sites is not None:
+            leased_sites.close()
+        if journal is not None:
+            journal.close()
         
         # Write the Summary details to summary.txt
-        write_summary(summary_txt_path, summary_data)
+        write_summary(summary_txt_path, run_info, crawl_metrics, metrics)
         
         logging.info("Summary written successfully. Exiting program.")
         
@@ -240,21 +359,101 @@ def main(browser, country, headless):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run Crawler to crawl websites")
     parser.add_argument("--browser", choices=["firefox", "chrome", "brave", "edge"], default="firefox", help="Browser to use: Firefox/Chrome/Edge/Brave (default: Firefox).")
-    parser.add_argument("--country", type=str, required=True, help="Country for which trending videos are to be fetched")
+    parser.add_argument("--country", type=str, required=True, help="Country the measurement is run from, recorded with the run.")
     parser.add_argument("--headless", action="store_true", default=False, help="Run browser in headless mode. (default: headful)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of parallel browser sessions. (default: 1)")
+    parser.add_argument("--proxy-base-port", type=int, default=None, help="First selenium-wire proxy port; worker k uses base + k. (default: random free port)")
+    parser.add_argument("--settle-idle", type=float, default=5, help="Seconds without new requests or responses after which a page counts as settled. (default: 5)")
+    parser.add_argument("--settle-min", type=float, default=2, help="Minimum seconds to wait for a page to settle. (default: 2)")
+    parser.add_argument("--settle-max", type=float, default=30, help="Maximum seconds to wait for a page to settle. (default: 30)")
+    parser.add_argument("--reuse-browser", type=int, default=0, metavar="N", help="Keep the browser warm and wipe its state between websites, relaunching every N websites or after an error. (default: 0, new browser per website)")
+    parser.add_argument("--input", type=str, default=os.path.join("crawling_csv", "tranco_list.csv"), help="Rank-ordered 'rank,domain' CSV to crawl. (default: crawling_csv/tranco_list.csv)")
+    parser.add_argument("--start-rank", type=int, default=None, help="First rank to crawl (inclusive).")
+    parser.add_argument("--end-rank", type=int, default=None, help="Last rank to crawl (inclusive).")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="K/N", help="Crawl only the K-th of N deterministic shards (rank %% N == K-1).")
+    parser.add_argument("--bucket-size", type=int, default=None, help="Rank bucket size for stratified sampling.")
+    parser.add_argument("--per-bucket", type=int, default=None, help="Websites sampled per rank bucket (requires --bucket-size).")
+    parser.add_argument("--sample-seed", type=int, default=0, help="Seed for stratified sampling, identical seeds select identical websites. (default: 0)")
+    parser.add_argument("--output-format", choices=list(OUTPUT_FILES), default="csv", help="Output backend: csv (legacy session.csv, one row per website), jsonl (gzip JSON lines) or parquet, one record per request. (default: csv)")
+    parser.add_argument("--output-batch-size", type=int, default=1000, help="Request records buffered before a jsonl/parquet write. (default: 1000)")
+    parser.add_argument("--body-store", action="store_true", default=False, help="Write response bodies once into a content-addressed store (response_bodies/) and keep only digest and size in the records.")
+    parser.add_argument("--body-skip-mime", type=lambda value: [mime.strip() for mime in value.split(",") if mime.strip()], default=None, help="Comma separated content type prefixes whose bodies are not kept, sets body_skip_content_types of the capture policy. (default with --body-store: image/,video/,audio/,font/)")
+    parser.add_argument("--max-body-size", type=int, default=None, help="Largest response body in bytes kept in the records or the --body-store, sets max_body_size of the capture policy. (default: no limit)")
+    parser.add_argument("--capture-mode", choices=["batch", "stream"], default="batch", help="batch: read all captured requests at the end of a visit; stream: build records as responses arrive, keeping memory bounded. (default: batch)")
+    parser.add_argument("--resume", type=str, default=None, metavar="RUN_DIR", help="Resume an interrupted run in RUN_DIR (e.g. measurements/2025-01-01_10-00-00): completed websites are skipped and outputs are appended to.")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts per website before it is recorded as failed; DNS and TLS failures are not retried. (default: 3)")
+    parser.add_argument("--retry-base-delay", type=float, default=60, help="Seconds before the first retry of a failed website, doubling per attempt. (default: 60)")
+    parser.add_argument("--screenshot-format", choices=["png", "webp", "jpeg"], default="png", help="Image format of stored screenshots, webp/jpeg need Pillow. (default: png)")
+    parser.add_argument("--screenshot-max-width", type=int, default=None, help="Downscale screenshots wider than this many pixels, needs Pillow. (default: full size)")
+    parser.add_argument("--screenshot-dedup-distance", type=int, default=0, help="Screenshots whose perceptual hash is within this many bits of a stored one are not written again: 0 only drops identical hashes, -1 disables deduplication. (default: 0)")
+    parser.add_argument("--screenshot-threads", type=int, default=2, help="Background threads encoding and writing screenshots per crawl process. (default: 2)")
+    parser.add_argument("--capture-policy", type=str, default=None, metavar="JSON_FILE", help="Capture policy for every browser: URL scopes and excludes, headers-only, body size and content type limits, request storage. (default: capture everything)")
+    parser.add_argument("--coordinator", type=str, default=None, metavar="URL_OR_DB", help="Lease rank ranges from a coordinator (http://host:port of 'coordinator.py serve' or a shared coordinator SQLite file) instead of reading the rank range directly.")
+    parser.add_argument("--host-id", type=str, default=socket.gethostname(), help="Name of this host in a coordinated run, also its output directory. (default: hostname)")
+    parser.add_argument("--browser-memory-budget", type=float, default=None, metavar="MB", help="Relaunch a browser whose process tree exceeds this RSS before its next website. (default: no budget)")
+    parser.add_argument("--memory-high-watermark", type=float, default=85, help="Host memory use in percent above which fewer workers take new websites. (default: 85)")
+    parser.add_argument("--memory-low-watermark", type=float, default=70, help="Host memory use in percent below which throttled workers resume. (default: 70)")
+    parser.add_argument("--governor-interval", type=float, default=5, help="Seconds between resource samples. (default: 5)")
+    parser.add_argument("--log-format", choices=["json", "text"], default="json", help="logfile.log as JSON lines with website_id, worker and phase fields, or plain text. (default: json)")
+    parser.add_argument("--log-verbose", action="store_true", default=False, help="Keep debug records (driver paths, per-step progress, process cleanup) in the log.")
+    parser.add_argument("--no-metrics-file", action="store_true", default=False, help=f"Do not export live metrics to {PROMETHEUS_FILENAME} (Prometheus text format) in the run directory.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve live metrics at http://127.0.0.1:PORT/metrics. (default: off)")
+    parser.add_argument("--metrics-interval", type=float, default=15, help=f"Seconds between exports to {PROMETHEUS_FILENAME}. (default: 15)")
+    parser.add_argument("--baseline", type=str, default=None, metavar="RUN_DIR", help="Incremental re-crawl against a previous run directory: its failed and missing websites first, then the rest.")
+    parser.add_argument("--changed-only", action="store_true", default=False, help="With --baseline, crawl websites the baseline completed only if their landing page fingerprint (redirect target, ETag, Last-Modified) changed.")
+    parser.add_argument("--probe-workers", type=int, default=16, help="Concurrent fingerprint probes for --changed-only. (default: 16)")
+    parser.add_argument("--prefilter", action="store_true", default=False, help="Probe websites concurrently (DNS, TCP, TLS, redirects) before the browsers: unreachable ones fail without a browser, the others are visited at their landing URL.")
+    parser.add_argument("--prefilter-concurrency", type=int, default=64, help="Concurrent --prefilter probes. (default: 64)")
+    parser.add_argument("--prefilter-timeout", type=float, default=15, help="Seconds until a --prefilter probe gives up and leaves the website to the browser. (default: 15)")
+    parser.add_argument("--capture-websockets", action="store_true", default=False, help="Write WebSocket messages to websocket_messages.jsonl.gz, bounded per connection.")
+    parser.add_argument("--websocket-max-messages", type=int, default=200, help="Messages kept per WebSocket connection. (default: 200)")
+    parser.add_argument("--websocket-max-bytes", type=int, default=256 * 1024, help="Payload bytes kept per WebSocket connection. (default: 262144)")
+    parser.add_argument("--websocket-sample-rate", type=float, default=1.0, help="Fraction of WebSocket messages kept before the caps apply. (default: 1.0)")
+    parser.add_argument("--websocket-hash-payloads", action="store_true", default=False, help="Store the SHA-256 of WebSocket payloads instead of the payloads.")
     args = parser.parse_args()
+    if args.coordinator and (args.shard or args.resume or args.start_rank or args.end_rank):
+        parser.error("--coordinator hands out the rank ranges, it cannot be combined with --shard, --resume, --start-rank or --end-rank")
+    if args.baseline and args.coordinator:
+        parser.error("--baseline cannot be combined with --coordinator")
+    if args.baseline and not os.path.exists(os.path.join(args.baseline, JOURNAL_FILENAME)):
+        parser.error(f"--baseline {args.baseline} has no {JOURNAL_FILENAME}")
+    if args.changed_only and not args.baseline:
+        parser.error("--changed-only requires --baseline")
+    try:
+        capture_policy = CapturePolicy.from_file(args.capture_policy) if args.capture_policy else None
+    except (OSError, ValueError, TypeError, re.error) as e:
+        parser.error(f"Invalid --capture-policy: {e}")
     
 
     country = args.country
     browser = args.browser
     headless = args.headless
     
-    main(browser=browser, country=country, headless=headless)
+    main(browser=browser, country=country, headless=headless, workers=args.workers, proxy_base_port=args.proxy_base_port,
+         settle_idle=args.settle_idle, settle_min=args.settle_min, settle_max=args.settle_max,
+         reuse_browser=args.reuse_browser, tranco_csv_path=args.input, start_rank=args.start_rank, end_rank=args.end_rank,
+         shard=args.shard, bucket_size=args.bucket_size, per_bucket=args.per_bucket, sample_seed=args.sample_seed,
+         output_format=args.output_format, output_batch_size=args.output_batch_size,
+         body_store=args.body_store, body_skip_mime=args.body_skip_mime, max_body_size=args.max_body_size,
+         capture_mode=args.capture_mode, resume_dir=args.resume,
+         max_attempts=args.max_attempts, retry_base_delay=args.retry_base_delay,
+         screenshot_format=args.screenshot_format, screenshot_max_width=args.screenshot_max_width,
+         screenshot_dedup_distance=args.screenshot_dedup_distance, screenshot_threads=args.screenshot_threads,
+         capture_policy=capture_policy, coordinator=args.coordinator, host_id=args.host_id,
+         browser_memory_budget=args.browser_memory_budget, memory_high_watermark=args.memory_high_watermark,
+         memory_low_watermark=args.memory_low_watermark, governor_interval=args.governor_interval,
+         log_format=args.log_format, log_verbose=args.log_verbose,
+         metrics_export=not args.no_metrics_file, metrics_port=args.metrics_port, metrics_interval=args.metrics_interval,
+         baseline_dir=args.baseline, changed_only=args.changed_only, probe_workers=args.probe_workers,
+         prefilter=args.prefilter, prefilter_concurrency=args.prefilter_concurrency, prefilter_timeout=args.prefilter_timeout,
+         websocket_capture=args.capture_websockets, websocket_max_messages=args.websocket_max_messages, websocket_max_bytes=args.websocket_max_bytes,
+         websocket_sample_rate=args.websocket_sample_rate, websocket_hash_payloads=args.websocket_hash_payloads)
     
     
     # Close logging
     logging.info("Session completed.")
     logging.info(f"Closing logging session. {datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+    stop_logging()
     logging.shutdown()
     
     # main()
\ No newline at end of file
@@ -0,0 +1,247 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+PROMETHEUS_FILENAME = "metrics.prom"
+
+# Upper bounds in seconds of the visit duration histogram
+VISIT_DURATION_BUCKETS = (5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """
+    Base of counters, gauges and histograms: one value per label combination.
+    """
+
+    kind = None
+
+    def __init__(self, name, help_text, lock):
+        self.name = name
+        self.help_text = help_text
+        self.lock = lock
+        self.values = {}
+
+    @staticmethod
+    def key(labels):
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+    def total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+    def by_label(self, label):
+        """
+        {label value: value}, summed over all other labels.
+        """
+        totals = {}
+        with self.lock:
+            for key, value in self.values.items():
+                label_value = dict(key).get(label)
+                totals[label_value] = totals.get(label_value, 0) + value
+        return totals
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(key)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, lock, buckets):
+        super().__init__(name, help_text, lock)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [bucket_count + (value <= bound) for bucket_count, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    def total(self):
+        with self.lock:
+            return sum(count for _, _, count in self.values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', format_value(bound)),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {format_value(total)}")
+                lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms of a crawl, safe to update from any thread of the main process.
+    Worker processes do not update it directly: their visit results reach the main process through
+    the result queue and are recorded there, so one registry covers all parallel workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text, self.lock))
+
+    def gauge(self, name, help_text):
+        return self.register(Gauge(name, help_text, self.lock))
+
+    def histogram(self, name, help_text, buckets):
+        return self.register(Histogram(name, help_text, self.lock, buckets))
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class CrawlMetrics:
+    """
+    The metrics of a crawl run and how a visit result updates them.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        self.start_time = self.registry.gauge("crawler_start_time_seconds", "Unix time the crawl started.")
+        self.visited = self.registry.counter("crawler_sites_visited_total", "Page loads attempted.")
+        self.results = self.registry.counter("crawler_site_results_total", "Finished visits by outcome (done, retry, failed).")
+        self.failures = self.registry.counter("crawler_failed_sites_total", "Websites given up on, by error class.")
+        self.skipped = self.registry.counter("crawler_sites_skipped_total", "Websites skipped because a previous session completed them.")
+        self.unchanged = self.registry.counter("crawler_sites_unchanged_total", "Websites not crawled because their fingerprint matches the baseline run.")
+        self.requests = self.registry.counter("crawler_requests_captured_total", "Captured web requests.")
+        self.output_bytes = self.registry.gauge("crawler_output_bytes", "Bytes of request output written, per worker partition.")
+        self.duration = self.registry.histogram("crawler_visit_duration_seconds", "Duration of a website visit.", VISIT_DURATION_BUCKETS)
+        self.start_time.set(round(time.time()))
+
+    def record(self, result, status):
+        """
+        Update the metrics with a finished visit; status is done, retry or failed.
+        """
+        worker = result.get("worker", 0)
+        if result["visited"]:
+            self.visited.inc(worker=worker)
+        self.results.inc(status=status)
+        if status == "failed":
+            self.failures.inc(error_class=result["error_class"])
+        self.requests.inc(result.get("requests") or 0, worker=worker)
+        if result.get("output_bytes") is not None:
+            self.output_bytes.set(result["output_bytes"], worker=worker)
+        self.duration.observe(sum((result.get("phases") or {}).values()))
+
+
+class MetricsExporter:
+    """
+    Exports a registry periodically to a Prometheus text file (atomically replaced, e.g. for the
+    node_exporter textfile collector) and/or serves it at http://<host>:<port>/metrics.
+    """
+
+    def __init__(self, registry, textfile_path=None, port=None, host="127.0.0.1", interval=15):
+        self.registry = registry
+        self.textfile_path = textfile_path
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        if self.port:
+            registry = self.registry
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = registry.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+            logging.info(f"Serving metrics at http://{self.host}:{self.port}/metrics")
+        if self.textfile_path:
+            self.thread = threading.Thread(target=self.run, name="metrics-export", daemon=True)
+            self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write_textfile()
+
+    def write_textfile(self):
+        try:
+            directory = os.path.dirname(os.path.abspath(self.textfile_path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.registry.render())
+            os.replace(tmp_path, self.textfile_path)
+        except OSError as e:
+            logging.warning(f"Failed to export metrics: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.textfile_path:
+            self.write_textfile()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,96 @@
+import os
+import sys
+import csv
+import gzip
+import json
+import glob
+import logging
+
+from output_sinks import OUTPUT_FILES
+
+
+# Approximate bytes of raw output handed to one worker process at a time
+CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def detect_output_format(run_dir):
+    """
+    Output format of a measurement run directory, by the files it contains.
+    """
+    for output_format in ("parquet", "jsonl", "csv"):
+        if os.path.exists(os.path.join(run_dir, OUTPUT_FILES[output_format])):
+            return output_format
+    raise FileNotFoundError(f"No crawler output found in {run_dir}")
+
+
+def iter_raw_chunks(run_dir, output_format=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Stream a run's output as (output_format, payload) chunks that are cheap to read in the main
+    process. The expensive JSON decoding happens in decode_chunk, typically inside a worker process.
+    Only one chunk is held in memory at a time.
+    """
+    output_format = output_format or detect_output_format(run_dir)
+    path = os.path.join(run_dir, OUTPUT_FILES[output_format])
+
+    if output_format == "parquet":
+        import pyarrow.parquet as pq
+        for part in sorted(glob.glob(os.path.join(path, "*.parquet"))):
+            try:
+                row_groups = pq.ParquetFile(part).num_row_groups
+            except Exception as e:
+                # Part files of a crawler that died before writing the footer
+                logging.warning(f"Skipping unreadable part file {part}: {e}")
+                continue
+            for row_group in range(row_groups):
+                yield output_format, (part, row_group)
+        return
+
+    if output_format == "csv":
+        # web_requests cells of a single website can be tens of MB
+        csv.field_size_limit(sys.maxsize)
+        file = open(path, 'r', newline='', encoding='utf-8')
+        rows = csv.reader(file)
+        next(rows, None)  # Skip header row
+    else:
+        file = gzip.open(path, 'rt', encoding='utf-8')
+        rows = file
+
+    with file:
+        chunk, size = [], 0
+        for row in rows:
+            chunk.append(row)
+            size += len(row[3]) if output_format == "csv" else len(row)
+            if size >= chunk_bytes:
+                yield output_format, chunk
+                chunk, size = [], 0
+        if chunk:
+            yield output_format, chunk
+
+
+def decode_chunk(chunk):
+    """
+    Turn a raw chunk from iter_raw_chunks into per-request records
+    ({"visit_timestamp", "website_id", "website_url", <request fields>}).
+    """
+    output_format, payload = chunk
+    records = []
+    if output_format == "csv":
+        for timestamp, website_id, website_url, web_requests in payload:
+            for request in json.loads(web_requests):
+                record = {"visit_timestamp": timestamp, "website_id": int(website_id), "website_url": website_url}
+                record.update(request)
+                records.append(record)
+    elif output_format == "jsonl":
+        for line in payload:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    else:
+        import pyarrow.parquet as pq
+        part, row_group = payload
+        for record in pq.ParquetFile(part).read_row_group(row_group).to_pylist():
+            for key in ("request_headers", "response_headers"):
+                if record.get(key):
+                    record[key] = json.loads(record[key])
+            records.append(record)
+    return records
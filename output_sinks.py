@@ -0,0 +1,345 @@
+import os
+import csv
+import gzip
+import json
+import zlib
+import shutil
+import logging
+from itertools import groupby
+
+from csv_storage import initialize_csv
+
+
+# Output formats and the file (or directory) they write into the measurement directory
+OUTPUT_FILES = {
+    "csv": "session.csv",
+    "jsonl": "requests.jsonl.gz",
+    "parquet": "requests.parquet",
+}
+
+# Columns identifying the website visit of a per-request record
+VISIT_COLUMNS = ("visit_timestamp", "website_id", "website_url")
+
+# Columns of one per-request record in the jsonl and parquet sinks
+REQUEST_COLUMNS = [
+    "visit_timestamp",
+    "website_id",
+    "website_url",
+    "timestamp",
+    "response_timestamp",
+    "duration_ms",
+    "url",
+    "method",
+    "status_code",
+    "request_headers",
+    "response_headers",
+    "location_header",
+    "response_body",
+    "response_body_sha256",
+    "response_body_size",
+    "response_body_skipped",
+    "request_body_size",
+]
+
+# Parquet column types other than string
+INTEGER_COLUMNS = ("website_id", "status_code", "response_body_size", "request_body_size")
+FLOAT_COLUMNS = ("duration_ms",)
+
+
+def iter_request_records(timestamp, website_id, website_url, web_requests):
+    """
+    Flatten the web requests of one website visit into one record per request.
+    """
+    for request in web_requests:
+        record = {"visit_timestamp": timestamp, "website_id": website_id, "website_url": website_url}
+        record.update(request)
+        yield record
+
+
+def is_empty(path):
+    return not os.path.exists(path) or os.path.getsize(path) == 0
+
+
+def repair_gzip(path, chunk_bytes=1024 * 1024):
+    """
+    Make a gzip file that is appended to member by member whole again after a crash. A member the
+    crashed writer never finished (it was only flushed) is replaced by a complete member holding its
+    complete lines, so the next member can be appended. Returns the number of lines recovered from
+    an unfinished member, 0 if the file was whole.
+    """
+    if is_empty(path):
+        return 0
+    # First pass: where the last member starts and whether it is complete
+    member_start, offset, broken = 0, 0, False
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    with open(path, 'rb') as f:
+        while not broken:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            while chunk:
+                try:
+                    decompressor.decompress(chunk)
+                except zlib.error:
+                    broken = True
+                    break
+                if not decompressor.eof:
+                    offset += len(chunk)
+                    break
+                offset += len(chunk) - len(decompressor.unused_data)
+                chunk = decompressor.unused_data
+                member_start = offset
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    if not broken and offset == member_start:
+        return 0
+
+    # Second pass: the complete lines of the unfinished member
+    recovered_path = path + ".recovered"
+    lines, tail = 0, b""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    with open(path, 'rb') as f, gzip.open(recovered_path, 'wb') as out:
+        f.seek(member_start)
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            try:
+                data = tail + decompressor.decompress(chunk)
+            except zlib.error:
+                break
+            cut = data.rfind(b"\n") + 1
+            out.write(data[:cut])
+            lines += data.count(b"\n", 0, cut)
+            tail = data[cut:]
+    with open(path, 'r+b') as f:
+        f.truncate(member_start)
+    if lines:
+        with open(path, 'ab') as f, open(recovered_path, 'rb') as recovered:
+            shutil.copyfileobj(recovered, f)
+    os.remove(recovered_path)
+    logging.warning(f"Repaired {path} after an interrupted run, {lines} lines of its last gzip member recovered")
+    return lines
+
+
+class OutputSink:
+    """
+    Base class of all output backends. A sink is opened once per run (or worker partition),
+    receives the web requests of every visited website and is closed at the end of the run.
+    Existing output is appended to, so a resumed run continues the files of the interrupted one.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def write_site(self, timestamp, website_id, website_url, web_requests):
+        self.write_records(iter_request_records(timestamp, website_id, website_url, web_requests))
+
+    def write_records(self, records):
+        """
+        Append per-request records, e.g. while they are streamed during a visit.
+        """
+        for record in records:
+            self.buffer.append(record)
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        raise NotImplementedError
+
+    def commit(self, force=False):
+        """
+        Make everything written so far readable, the point after which the journal may mark the
+        websites done. Returns False while the backend still holds records back to write them in
+        larger batches (parquet), unless forced.
+        """
+        self.flush()
+        return True
+
+    def bytes_written(self):
+        """
+        Size of the output file on disk, including output of resumed sessions.
+        """
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def close(self):
+        self.flush()
+
+
+class CsvSink(OutputSink):
+    """
+    Legacy backend: one session.csv row per website with all web requests as a JSON cell.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        super().__init__(path, batch_size)
+        if is_empty(path):
+            initialize_csv(path)
+        self.file = open(path, 'a', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+
+    def write_site(self, timestamp, website_id, website_url, web_requests):
+        # One cell holds all requests of the website, web_requests may be an iterator
+        self.writer.writerow([timestamp, website_id, website_url, json.dumps(list(web_requests))])
+        self.file.flush()
+
+    def flush(self):
+        # Per-request records (write_records) become one row per website visit
+        for (timestamp, website_id, website_url), records in groupby(self.buffer, key=lambda record: (
+                record["visit_timestamp"], record["website_id"], record["website_url"])):
+            requests = [{key: value for key, value in record.items() if key not in VISIT_COLUMNS} for record in records]
+            self.writer.writerow([timestamp, website_id, website_url, json.dumps(requests)])
+        self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class JsonlSink(OutputSink):
+    """
+    Gzip compressed JSON lines, one line per web request.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        super().__init__(path, batch_size)
+        # A crashed session leaves an unfinished gzip member, appending after it would break the file
+        repair_gzip(path)
+        self.file = gzip.open(path, 'at', encoding='utf-8', compresslevel=5)
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("".join(json.dumps(record) + "\n" for record in self.buffer))
+            self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class ParquetSink(OutputSink):
+    """
+    Parquet part files with one row per web request. A parquet file is only readable once its
+    footer is written, so records are buffered until commit() and each commit of at least
+    batch_size requests (or a forced one) writes one complete part file under a temporary name
+    and renames it into place. A crash never leaves a part file behind that readers cannot open.
+    Header dictionaries are stored as JSON strings. Requires pyarrow.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        super().__init__(path, batch_size)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.schema = pa.schema([
+            (column, pa.int64() if column in INTEGER_COLUMNS else pa.float64() if column in FLOAT_COLUMNS else pa.string())
+            for column in REQUEST_COLUMNS
+        ])
+        self.pq = pq
+        self.part_path = path
+        self.parts = 0
+        self.committed_bytes = 0
+
+    def flush(self):
+        # Records are written by commit(), a half-written part file would not be readable
+        pass
+
+    def commit(self, force=False):
+        if not self.buffer:
+            return True
+        if len(self.buffer) < self.batch_size and not force:
+            return False
+        rows = []
+        for record in self.buffer:
+            rows.append({
+                column: json.dumps(record.get(column)) if isinstance(record.get(column), (dict, list)) else record.get(column)
+                for column in REQUEST_COLUMNS
+            })
+        temp_path = self.part_path + ".tmp"
+        self.pq.write_table(self.pa.Table.from_pylist(rows, schema=self.schema), temp_path, compression="zstd")
+        os.replace(temp_path, self.part_path)
+        self.committed_bytes += os.path.getsize(self.part_path)
+        self.buffer = []
+        self.part_path = self.next_part_path()
+        return True
+
+    def next_part_path(self):
+        stem = self.path[:-len(".parquet")]
+        while True:
+            self.parts += 1
+            path = f"{stem}-{self.parts}.parquet"
+            if not os.path.exists(path):
+                return path
+
+    def bytes_written(self):
+        return self.committed_bytes
+
+    def close(self):
+        self.commit(force=True)
+
+
+SINKS = {
+    "csv": CsvSink,
+    "jsonl": JsonlSink,
+    "parquet": ParquetSink,
+}
+
+
+def get_output_path(output_format, base_path, partition=None):
+    """
+    Path of the run output, or of one worker partition of it.
+    Parquet output is a directory of part files, which parquet readers load as one dataset.
+    """
+    filename = OUTPUT_FILES[output_format]
+    if output_format == "parquet":
+        # Parquet files cannot be appended to, a resumed run adds new part files
+        os.makedirs(os.path.join(base_path, filename), exist_ok=True)
+        path = os.path.join(base_path, filename, f"part-{partition or 0}.parquet")
+        segment = 0
+        while os.path.exists(path):
+            segment += 1
+            path = os.path.join(base_path, filename, f"part-{partition or 0}-{segment}.parquet")
+        return path
+    if partition is None:
+        return os.path.join(base_path, filename)
+    name, extension = filename.split(".", 1)
+    return os.path.join(base_path, f"{name}_worker_{partition}.{extension}")
+
+
+def create_sink(output_format, base_path, partition=None, batch_size=1000):
+    path = get_output_path(output_format, base_path, partition)
+    logging.info(f"Writing {output_format} output to: {path}")
+    return SINKS[output_format](path, batch_size=batch_size)
+
+
+def merge_sink_partitions(output_format, base_path, partitions):
+    """
+    Merge worker partitions into the run output.
+    CSV partitions are concatenated with a single header row, gzip members can be concatenated
+    as they are, parquet part files already form one dataset.
+    """
+    if output_format == "parquet":
+        return
+    output_path = get_output_path(output_format, base_path)
+    if output_format == "csv" and is_empty(output_path):
+        initialize_csv(output_path)
+    with open(output_path, 'ab') as out:
+        for partition in partitions:
+            path = get_output_path(output_format, base_path, partition)
+            if not os.path.exists(path):
+                continue
+            if output_format == "jsonl":
+                # Partition of a worker that died
+                repair_gzip(path)
+            with open(path, 'rb') as part:
+                if output_format == "csv":
+                    part.readline()  # Skip header row
+                shutil.copyfileobj(part, out)
+            os.remove(path)
+    logging.info(f"Merged {len(partitions)} worker partitions into {output_path}")
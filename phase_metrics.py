@@ -0,0 +1,112 @@
+import json
+import time
+import math
+import logging
+from array import array
+from contextlib import contextmanager
+
+from crawl_logging import log_context
+
+
+# Phases of a website visit, in the order they happen
+PHASES = [
+    "setup_webdriver",
+    "driver_get",
+    "wait_for_page_load",
+    "screenshot",
+    "scroll",
+    "settle",
+    "websockets",
+    "capture",
+    "store",
+    "close_browser",
+]
+
+METRICS_FILENAME = "metrics.jsonl"
+
+
+class PhaseTimer:
+    """
+    Measures how long each phase of one website visit takes.
+    """
+
+    def __init__(self):
+        self.durations = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            with log_context(phase=name):
+                yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+
+def percentile(sorted_values, q):
+    """
+    Nearest-rank percentile of an already sorted sequence.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class PhaseMetrics:
+    """
+    Collects the phase timings and resource peaks of every visited website in the main process:
+    appends them to metrics.jsonl in the run directory and aggregates p50/p95/p99 per phase.
+    """
+
+    def __init__(self, metrics_path):
+        self.metrics_path = metrics_path
+        self.durations = {}
+        self.start = time.monotonic()
+        self.sites = 0
+        self.peak_resources = {}
+
+    def record(self, result):
+        phases = result.get("phases") or {}
+        self.sites += 1
+        for name, duration in phases.items():
+            self.durations.setdefault(name, array('d')).append(duration)
+        line = {
+            "website_id": result["website_id"],
+            "worker": result.get("worker"),
+            "success": result["success"],
+            "phases": {name: round(duration, 3) for name, duration in phases.items()},
+            "total": round(sum(phases.values()), 3),
+        }
+        if result.get("resources"):
+            line["resources"] = result["resources"]
+            for key, value in result["resources"].items():
+                self.peak_resources[key] = max(self.peak_resources.get(key, value), value)
+        try:
+            with open(self.metrics_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(line) + "\n")
+        except OSError as e:
+            logging.warning(f"Failed to write phase metrics: {e}")
+
+    def sites_per_hour(self):
+        elapsed = time.monotonic() - self.start
+        return round(self.sites / elapsed * 3600, 1) if elapsed > 0 else 0.0
+
+    def resource_summary(self):
+        """
+        Peak sampled resource usage of the run, e.g. {"browser_rss_mb": 812.4, ...}.
+        """
+        return dict(self.peak_resources)
+
+    def phase_summary(self):
+        """
+        {phase: "p50=..s p95=..s p99=..s (n=..)"} for the summary file.
+        """
+        summary = {}
+        for name in PHASES + sorted(set(self.durations) - set(PHASES)):
+            values = sorted(self.durations.get(name, []))
+            if not values:
+                continue
+            summary[name] = (f"p50={percentile(values, 50):.2f}s p95={percentile(values, 95):.2f}s "
+                             f"p99={percentile(values, 99):.2f}s (n={len(values)})")
+        return summary
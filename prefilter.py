@@ -0,0 +1,111 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+
+PREFILTER_TIMEOUT = 15
+MAX_REDIRECTS = 10
+PREFILTER_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"
+
+
+async def probe_site(session, domain, timeout=PREFILTER_TIMEOUT):
+    """
+    Connectivity of a website's landing page as the browser would start its visit: DNS, TCP,
+    TLS handshake and redirects of https://<domain>/. Certificates are not verified, like behind
+    the interception proxy. Returns {"landing_url", "status", "error", "error_class", "seconds"};
+    error_class is dns, tls or unreachable when the browser visit would fail for sure, otherwise
+    None (inconclusive failures are left to the browser).
+    """
+    start = time.perf_counter()
+    probe = {"landing_url": None, "status": None, "error": None, "error_class": None}
+    try:
+        async with session.get(f"https://{domain}/", allow_redirects=True, max_redirects=MAX_REDIRECTS,
+                               timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            probe["landing_url"] = str(response.url)
+            probe["status"] = response.status
+    except aiohttp.ClientConnectorDNSError as e:
+        probe["error"], probe["error_class"] = f"Prefilter DNS lookup failed: {e}", "dns"
+    except (aiohttp.ClientConnectorSSLError, aiohttp.ClientSSLError) as e:
+        probe["error"], probe["error_class"] = f"Prefilter TLS handshake failed: {e}", "tls"
+    except aiohttp.ClientConnectorError as e:
+        probe["error"], probe["error_class"] = f"Prefilter TCP connect failed: {e}", "unreachable"
+    except aiohttp.TooManyRedirects:
+        probe["error"], probe["error_class"] = f"Prefilter gave up after {MAX_REDIRECTS} redirects", "unreachable"
+    except asyncio.TimeoutError:
+        # A slow website is not a dead one, the browser gets its own (longer) chance
+        probe["error"] = f"Prefilter timed out after {timeout} seconds"
+    except Exception as e:
+        probe["error"] = f"{type(e).__name__}: {e}"
+    probe["seconds"] = round(time.perf_counter() - start, 3)
+    return probe
+
+
+class ConnectivityPrefilter:
+    """
+    Stage of the site stream in front of the browsers: probes upcoming websites concurrently
+    (probe_site, up to `concurrency` at a time) on an asyncio event loop in a background thread and
+    yields (website_id, domain, probe) in the order the probes finish, so reachable websites are not
+    held up by dead ones. The crawl visits the probe's landing URL, and a website the probe found
+    unreachable fails right away without a browser. Only a bounded number of probed websites wait
+    for a browser at any time.
+    """
+
+    def __init__(self, sites, concurrency=64, timeout=PREFILTER_TIMEOUT):
+        self.sites = sites
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.error = None
+
+    def __iter__(self):
+        results = queue.Queue(maxsize=self.concurrency)
+        thread = threading.Thread(target=asyncio.run, args=(self.run(results),), name="connectivity-prefilter", daemon=True)
+        thread.start()
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            yield item
+        thread.join()
+        if self.error is not None:
+            raise self.error
+
+    async def run(self, results):
+        # Site sources may block (leases, fingerprint probes) or be bound to the thread that
+        # started iterating them (SQLite), so they are always advanced by the same helper thread
+        reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefilter-input")
+        loop = asyncio.get_running_loop()
+        sites = iter(self.sites)
+        try:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=False, ttl_dns_cache=300)
+            async with aiohttp.ClientSession(connector=connector, headers={"User-Agent": PREFILTER_USER_AGENT}) as session:
+                pending = set()
+                exhausted = False
+                while pending or not exhausted:
+                    while not exhausted and len(pending) < self.concurrency:
+                        site = await loop.run_in_executor(reader, next, sites, None)
+                        if site is None:
+                            exhausted = True
+                        else:
+                            pending.add(asyncio.ensure_future(self.probe(session, *site)))
+                    if not pending:
+                        break
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        # Blocks while the browsers are busy, which also holds back new probes
+                        await asyncio.to_thread(results.put, task.result())
+        except Exception as e:
+            self.error = e
+        finally:
+            reader.shutdown(wait=False)
+            results.put(None)
+
+    async def probe(self, session, website_id, domain):
+        probe = await probe_site(session, domain, self.timeout)
+        if probe["error_class"]:
+            logging.info(f"Prefilter: website #{website_id} ({domain}) {probe['error_class']}: {probe['error']}")
+        return website_id, domain, probe
@@ -0,0 +1,99 @@
+import json
+import sqlite3
+from datetime import datetime
+
+
+JOURNAL_FILENAME = "journal.sqlite"
+
+
+class ProgressJournal:
+    """
+    Persistent record of every website of a measurement run: status, attempts and output location.
+    Lets an interrupted run be resumed with --resume without crawling finished websites again.
+    Only the main process writes to the journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS sites (
+                website_id INTEGER PRIMARY KEY,
+                domain TEXT,
+                status TEXT,
+                attempts INTEGER DEFAULT 0,
+                output TEXT,
+                error TEXT,
+                error_class TEXT,
+                updated_at TEXT,
+                fingerprint TEXT
+            )
+        """)
+        # Journals of older runs lack the error classification and the landing page fingerprint
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(sites)")}
+        if "error_class" not in columns:
+            self.connection.execute("ALTER TABLE sites ADD COLUMN error_class TEXT")
+        if "fingerprint" not in columns:
+            self.connection.execute("ALTER TABLE sites ADD COLUMN fingerprint TEXT")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.commit()
+
+    def completed_sites(self):
+        """
+        Set of website_ids that finished successfully (or were unchanged since the baseline run).
+        """
+        return {row[0] for row in self.connection.execute("SELECT website_id FROM sites WHERE status IN ('done', 'unchanged')")}
+
+    def site(self, website_id):
+        """
+        {"status", "output", "fingerprint"} of a website, or None if the run never got to it.
+        """
+        row = self.connection.execute("SELECT status, output, fingerprint FROM sites WHERE website_id = ?", (website_id,)).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "output": row[1], "fingerprint": json.loads(row[2]) if row[2] else None}
+
+    def record_result(self, website_id, domain, status, output=None, error=None, error_class=None):
+        """
+        Record one attempt of a website. status is done, retry_pending, failed or unchanged.
+        """
+        self.connection.execute("""
+            INSERT INTO sites (website_id, domain, status, attempts, output, error, error_class, updated_at)
+            VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+            ON CONFLICT(website_id) DO UPDATE SET
+                status = excluded.status,
+                attempts = sites.attempts + 1,
+                output = excluded.output,
+                error = excluded.error,
+                error_class = excluded.error_class,
+                updated_at = excluded.updated_at
+        """, (website_id, domain, status, output, error, error_class, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        self.connection.commit()
+
+    def record_fingerprint(self, website_id, domain, fingerprint):
+        """
+        Remember the landing page fingerprint of a website, compared by the next incremental run.
+        """
+        self.connection.execute("""
+            INSERT INTO sites (website_id, domain, fingerprint, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(website_id) DO UPDATE SET fingerprint = excluded.fingerprint
+        """, (website_id, domain, json.dumps(fingerprint) if fingerprint else None, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        self.connection.commit()
+
+    def status_counts(self):
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM sites GROUP BY status"))
+
+    def save_settings(self, settings):
+        """
+        Remember the settings of the run, so a resume can detect changes.
+        Returns the settings stored by a previous session of the run (or None).
+        """
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+        previous = json.loads(row[0]) if row else None
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('settings', ?)", (json.dumps(settings, default=str),))
+        self.connection.commit()
+        return previous
+
+    def close(self):
+        self.connection.close()
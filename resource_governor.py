@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import threading
+
+import psutil
+
+
+MB = 2 ** 20
+
+
+class ResourceGovernor:
+    """
+    Background thread of a crawl process sampling RSS and CPU of its browser session's process tree
+    (driver service, browser and its children) and of the crawl process itself, which hosts
+    selenium-wire's mitmproxy backend. Peaks per visit are reported through visit_stats().
+    When the browser tree exceeds rss_budget_mb, the session is asked to relaunch its browser
+    before the next website.
+    """
+
+    def __init__(self, session, interval=5, rss_budget_mb=None):
+        self.session = session
+        self.interval = interval
+        self.rss_budget_mb = rss_budget_mb
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.crawler = psutil.Process(os.getpid())
+        # psutil.Process objects are kept between samples, cpu_percent() measures since the last call
+        self.processes = {}
+        self.peaks = {}
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="resource-governor", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logging.warning(f"Resource sampling failed: {e}")
+
+    def sample(self):
+        """
+        One sample of the session's resources; returns {"browser_rss_mb", "browser_cpu_percent", "crawler_rss_mb", "host_memory_percent"}.
+        """
+        tree = {process.pid: process for process in self.session.process_tree()}
+        self.processes = {pid: self.processes.get(pid, process) for pid, process in tree.items()}
+        browser_rss = browser_cpu = 0.0
+        for process in self.processes.values():
+            try:
+                browser_rss += process.memory_info().rss
+                browser_cpu += process.cpu_percent()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        sample = {
+            "browser_rss_mb": round(browser_rss / MB, 1),
+            "browser_cpu_percent": round(browser_cpu, 1),
+            "crawler_rss_mb": round(self.crawler.memory_info().rss / MB, 1),
+            "host_memory_percent": psutil.virtual_memory().percent,
+        }
+        with self.lock:
+            for key, value in sample.items():
+                self.peaks[key] = max(self.peaks.get(key, value), value)
+
+        if self.rss_budget_mb and sample["browser_rss_mb"] > self.rss_budget_mb:
+            self.session.request_relaunch(f"browser uses {sample['browser_rss_mb']} MB, budget {self.rss_budget_mb} MB")
+        return sample
+
+    def visit_stats(self):
+        """
+        Peak resource usage since the previous call, i.e. during the last visit.
+        """
+        with self.lock:
+            peaks, self.peaks = self.peaks, {}
+        return peaks
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 5)
+
+
+class ConcurrencyThrottle:
+    """
+    Parent-side thread of the worker pool: lowers the number of workers allowed to take new
+    websites (allowed.value, shared with the workers) by one per interval while host memory use is
+    above high_watermark percent, and raises it again below low_watermark. At least one worker keeps going.
+    """
+
+    def __init__(self, allowed, num_workers, high_watermark=85, low_watermark=70, interval=5):
+        self.allowed = allowed
+        self.num_workers = num_workers
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="concurrency-throttle", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            memory_percent = psutil.virtual_memory().percent
+            allowed = self.allowed.value
+            if memory_percent > self.high_watermark and allowed > 1:
+                self.allowed.value = allowed - 1
+                logging.warning(f"Host memory at {memory_percent}%, throttling to {allowed - 1} of {self.num_workers} workers")
+            elif memory_percent < self.low_watermark and allowed < self.num_workers:
+                self.allowed.value = allowed + 1
+                logging.info(f"Host memory at {memory_percent}%, allowing {allowed + 1} of {self.num_workers} workers")
+
+    def stop(self):
+        """
+        Stop throttling and let every worker run again, so paused workers drain their exit markers.
+        """
+        self.stop_event.set()
+        self.allowed.value = self.num_workers
+
+
+def wait_until_allowed(worker_id, allowed, session, poll_interval=1, before_pause=None):
+    """
+    Hold a throttled worker before its next website. Its browser is closed while it waits,
+    so the memory is actually released. before_pause runs first, e.g. to commit the results
+    the worker still holds, which others may be waiting for.
+    """
+    if allowed is None or worker_id < allowed.value:
+        return
+    logging.info(f"Worker {worker_id} paused by the concurrency throttle.")
+    if before_pause is not None:
+        before_pause()
+    session.close()
+    while worker_id >= allowed.value:
+        time.sleep(poll_interval)
+    logging.info(f"Worker {worker_id} resumed.")
@@ -0,0 +1,155 @@
+import time
+import heapq
+import queue
+import logging
+import threading
+
+
+# Error classes, matched against the exception type and message of a failed visit (first match wins).
+# Messages contain the visited URL, so markers are error codes and names no host name contains
+ERROR_CLASSES = [
+    ("dns", ["ERR_NAME_NOT_RESOLVED", "dnsNotFound", "Name or service not known", "getaddrinfo", "NXDOMAIN", "No address associated"]),
+    ("tls", ["ERR_CERT_", "ERR_SSL_", "SSLError", "[SSL:", "SSL handshake", "TLS handshake", "nssFailure", "SEC_ERROR_",
+             "MOZILLA_PKIX_ERROR_", "CERTIFICATE_VERIFY_FAILED"]),
+    ("proxy", ["ERR_PROXY", "proxyConnectFailure", "ERR_TUNNEL_CONNECTION_FAILED", "ProxyError"]),
+    ("driver_crash", ["invalid session id", "InvalidSessionId", "not reachable", "disconnected", "session deleted",
+                      "Process unexpectedly closed", "Connection refused", "Max retries exceeded", "crashed", "NoSuchWindow"]),
+    ("timeout", ["TimeoutException", "timed out", "Timeout", "ERR_TIMED_OUT", "netTimeout", "HTTPConnectionPool"]),
+]
+
+# Permanent failures of the website itself, retrying them rarely helps.
+# unreachable is set by the connectivity prefilter, which already gave the website a full timeout
+NON_RETRYABLE_CLASSES = {"dns", "unreachable"}
+
+# Behind the interception proxy, a TLS error in the browser usually means the crawler's CA is not
+# trusted (yet), so tls is only permanent when the prefilter's own handshake with the website failed
+PREFILTER_NON_RETRYABLE_CLASSES = {"tls"}
+
+
+def is_permanent_failure(result):
+    """
+    Whether a failed visit result is not worth retrying.
+    """
+    error_class = result.get("error_class")
+    return error_class in NON_RETRYABLE_CLASSES or (result.get("prefiltered", False) and error_class in PREFILTER_NON_RETRYABLE_CLASSES)
+
+
+def classify_error(error_type, message):
+    """
+    Classify a failed visit as dns, tls, proxy, driver_crash, timeout or other.
+    """
+    text = f"{error_type or ''}: {message or ''}"
+    for error_class, markers in ERROR_CLASSES:
+        if any(marker.lower() in text.lower() for marker in markers):
+            return error_class
+    return "other"
+
+
+class RetryScheduler:
+    """
+    Feeds websites to the crawl: failed websites are pushed to a retry queue and handed out again
+    after an exponential backoff (base_delay * 2^(attempt-1), capped at max_delay), interleaved with
+    fresh websites so the pipeline never blocks on a retry. A website is given up after max_attempts.
+    Fresh websites are read from the source by a background thread, so a source that blocks (e.g.
+    waiting for leases this host still holds) never holds back a due retry.
+    Iterating is thread-safe with record_result, so the pool's feeder thread can iterate while the
+    main process records results. on_idle is called whenever it waits, for visits in flight or for the source.
+    """
+
+    def __init__(self, sites, max_attempts=3, base_delay=60, max_delay=1800, on_idle=None):
+        self.sites = sites
+        self.fresh = queue.Queue(maxsize=1)
+        self.reader = None
+        self.error = None
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.retries = []
+        self.attempts = {}
+        # Site tuples handed out, a retry is queued with everything the source attached (e.g. the probe)
+        self.handed_out = {}
+        self.in_flight = 0
+        self.sequence = 0
+        self.sites_exhausted = False
+        self.on_idle = on_idle
+
+    def next_site(self):
+        """
+        Next site tuple (website_id, domain[, probe]) to crawl: a due retry, else a fresh website. While only retries
+        (or visits that may still fail) are pending, waits for them. Returns None when all is done.
+        """
+        with self.lock:
+            if self.reader is None:
+                self.reader = threading.Thread(target=self.read_sites, name="retry-scheduler-input", daemon=True)
+                self.reader.start()
+        while True:
+            with self.lock:
+                if self.retries and self.retries[0][0] <= time.monotonic():
+                    _, _, site = heapq.heappop(self.retries)
+                    self.in_flight += 1
+                    self.handed_out[site[0]] = site
+                    logging.info(f"Retrying website #{site[0]} (attempt {self.attempts[site[0]] + 1} of {self.max_attempts})")
+                    return site
+                if self.sites_exhausted and not self.retries and self.in_flight == 0:
+                    return None
+                sites_exhausted = self.sites_exhausted
+
+            if sites_exhausted:
+                if self.on_idle is not None:
+                    self.on_idle()
+                time.sleep(1)
+                continue
+
+            try:
+                site = self.fresh.get(timeout=1)
+            except queue.Empty:
+                # The source is still waiting, retries may come due meanwhile
+                if self.on_idle is not None:
+                    self.on_idle()
+                continue
+            with self.lock:
+                if site is None:
+                    self.sites_exhausted = True
+                    if self.error is not None:
+                        raise self.error
+                    continue
+                self.in_flight += 1
+                self.handed_out[site[0]] = site
+            return site
+
+    def read_sites(self):
+        try:
+            for site in self.sites:
+                self.fresh.put(site)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.fresh.put(None)
+
+    def __iter__(self):
+        while True:
+            site = self.next_site()
+            if site is None:
+                return
+            yield site
+
+    def record_result(self, result):
+        """
+        Record a finished visit. Returns "done", "retry" (queued again) or "failed" (given up).
+        """
+        website_id = result["website_id"]
+        with self.lock:
+            self.in_flight -= 1
+            site = self.handed_out.pop(website_id, (website_id, result["domain"]))
+            attempts = self.attempts.pop(website_id, 0) + 1
+            if result["success"]:
+                return "done"
+            if is_permanent_failure(result) or attempts >= self.max_attempts:
+                return "failed"
+            self.attempts[website_id] = attempts
+            delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+            self.sequence += 1
+            heapq.heappush(self.retries, (time.monotonic() + delay, self.sequence, site))
+        logging.info(f"Website #{website_id} failed ({result.get('error_class')}), retry {attempts + 1} of {self.max_attempts} in {delay} seconds")
+        return "retry"
@@ -0,0 +1,193 @@
+import io
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+SCREENSHOT_INDEX_FILENAME = "screenshots_index.jsonl"
+
+SCREENSHOT_FORMATS = {"png": ("PNG", ".png"), "webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+
+# Side of the dHash thumbnail: 16x16 = 256 bit hashes, which distinct pages rarely share
+HASH_SIZE = 16
+
+
+def difference_hash(image, hash_size=HASH_SIZE):
+    """
+    Perceptual difference hash (dHash) of hash_size^2 bits: compares the brightness of neighbouring
+    pixels of a tiny grayscale thumbnail, so re-encoded or slightly different renderings of the
+    same page (error pages, parking pages) get the same or a close hash.
+    """
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size)).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = value << 1 | (left > right)
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class HashIndex:
+    """
+    Paths of stored screenshots by hash. Near matches (perceptual hashes within `distance` bits)
+    are found through bucket maps instead of a scan: the hash is split into distance + 1 bands,
+    and a hash within `distance` bits of a stored one matches it exactly in at least one band,
+    so only the hashes sharing a band are compared.
+    """
+
+    def __init__(self, bits=HASH_SIZE * HASH_SIZE, distance=0):
+        self.distance = distance
+        self.paths = {}
+        self.bands = []
+        if distance > 0:
+            count = min(distance + 1, bits)
+            shift = 0
+            for band in range(count):
+                width = bits // count + (1 if band < bits % count else 0)
+                self.bands.append((shift, (1 << width) - 1))
+                shift += width
+        self.buckets = [{} for _ in self.bands]
+
+    def add(self, value, path):
+        if value in self.paths:
+            return
+        self.paths[value] = path
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            buckets.setdefault(value >> shift & mask, []).append(value)
+
+    def find(self, value):
+        path = self.paths.get(value)
+        if path is not None or not self.bands:
+            return path
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            for known in buckets.get(value >> shift & mask, ()):
+                if hamming_distance(known, value) <= self.distance:
+                    return self.paths[known]
+        return None
+
+
+class ScreenshotPipeline:
+    """
+    Encodes and writes screenshots in background threads, so the crawl only waits for the
+    browser to render the PNG. Optionally downscales and converts to WebP/JPEG (needs Pillow),
+    drops screenshots whose perceptual hash equals an already stored one (or, opt-in, is within
+    dedup_distance bits of it; -1 disables deduplication), and appends one line per website to
+    screenshots_index.jsonl.
+    Without Pillow, PNGs are written as-is and only byte-identical screenshots are deduplicated.
+    """
+
+    def __init__(self, base_path, image_format="png", max_width=None, dedup_distance=0, threads=2, max_pending=8):
+        self.root = os.path.join(base_path, "website_screenshots")
+        self.index_path = os.path.join(base_path, SCREENSHOT_INDEX_FILENAME)
+        self.image_format = image_format
+        self.max_width = max_width
+        self.dedup_distance = dedup_distance
+        if Image is None and (image_format != "png" or max_width):
+            logging.warning("Pillow is not installed, screenshots are kept as full size PNG.")
+            self.image_format, self.max_width = "png", None
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="screenshot")
+        # Bounds the encoded-but-unwritten screenshots held in memory
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        # Byte-identical matches only without Pillow, sha256 hashes have no distance
+        self.hashes = HashIndex(distance=dedup_distance if Image is not None else 0)
+        self.stored = 0
+        self.duplicates = 0
+
+    def submit(self, website_id, domain, png):
+        """
+        Queue the PNG bytes of a website's screenshot. Blocks only while max_pending are queued.
+        """
+        self.pending.acquire()
+        try:
+            self.executor.submit(self.process, website_id, domain, png)
+        except Exception:
+            self.pending.release()
+            raise
+
+    def process(self, website_id, domain, png):
+        try:
+            entry = self.encode_and_store(website_id, domain, png)
+            self.append_index(entry)
+        except Exception as e:
+            logging.error(f"Failed to store screenshot of website #{website_id}: {e}")
+        finally:
+            self.pending.release()
+
+    def encode_and_store(self, website_id, domain, png):
+        entry = {"website_id": website_id, "domain": domain, "path": None, "duplicate_of": None}
+        if Image is not None:
+            image = Image.open(io.BytesIO(png))
+            image.load()
+            entry["phash"] = f"{difference_hash(image):0{HASH_SIZE * HASH_SIZE // 4}x}"
+            hash_value = int(entry["phash"], 16)
+        else:
+            image = None
+            hash_value = entry["sha256"] = hashlib.sha256(png).hexdigest()
+
+        duplicate = self.find_duplicate(hash_value)
+        if duplicate is not None:
+            entry["path"] = entry["duplicate_of"] = duplicate
+            return entry
+
+        pil_format, extension = SCREENSHOT_FORMATS[self.image_format]
+        if image is not None and (self.image_format != "png" or (self.max_width and image.width > self.max_width)):
+            if self.max_width and image.width > self.max_width:
+                image = image.resize((self.max_width, round(image.height * self.max_width / image.width)))
+            if pil_format == "JPEG":
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format)
+            data = buffer.getvalue()
+        else:
+            data = png
+
+        relative_path = os.path.join(domain, domain + extension)
+        path = os.path.join(self.root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        entry["path"] = relative_path
+        entry["bytes"] = len(data)
+        with self.lock:
+            self.hashes.add(hash_value, relative_path)
+            self.stored += 1
+        logging.debug(f"Screenshot saved to {path}")
+        return entry
+
+    def find_duplicate(self, hash_value):
+        """
+        Path of an already stored screenshot with the same (or, for perceptual hashes, a close) hash.
+        """
+        if self.dedup_distance < 0:
+            return None
+        with self.lock:
+            duplicate = self.hashes.find(hash_value)
+            if duplicate is not None:
+                self.duplicates += 1
+        return duplicate
+
+    def append_index(self, entry):
+        # One short append per line, so worker processes can share the index file
+        with self.lock, open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        """
+        Wait for all queued screenshots to be written.
+        """
+        self.executor.shutdown(wait=True)
+        logging.info(f"Screenshots: {self.stored} stored, {self.duplicates} duplicates dropped")
@@ -12,10 +12,12 @@ from selenium.webdriver.edge.options import Options as EdgeOptions
 import logging
 import platform
 import os
-import subprocess
+import threading
 import psutil
 import shutil
 
+from capture_policy import CapturePolicy
+
 
 current_os = platform.system().lower()
 created_stateful_profile_path = None
@@ -29,24 +31,35 @@ def get_driver_path(driver_name):
         executable = os.path.join(driver_path, driver_name)
     return executable
 
-def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path=None):
+def stateless_profile_dir(browser_profile_path):
+    """
+    Chrome user data directory of a stateless browser launched with browser_profile_path.
+    """
+    return os.path.join(browser_profile_path, "profile_directory")
+
+
+def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path=None, proxy_port=None, seleniumwire_overrides=None, capture_policy=None):
     """
     Set up the WebDriver based on the selected browser and headless mode.
+    proxy_port pins the selenium-wire backend to a fixed port (default: random free port).
+    capture_policy (CapturePolicy) decides what the proxy captures, the same for every browser (default: everything).
+    seleniumwire_overrides are merged into the browser's selenium-wire options.
     """
     global current_os
     
     # Local driver variable
     driver = None
     
+    capture_policy = capture_policy or CapturePolicy()
+    seleniumwire_options = capture_policy.seleniumwire_options(proxy_port)
+    if browser == 'edge':
+        seleniumwire_options['http2'] = False  # Force HTTP/1.1
+    seleniumwire_options.update(seleniumwire_overrides or {})
+    
     logging.info(f"Setting up WebDriver for browser: {browser}")
     
     
     if browser == "firefox":
-        seleniumwire_options = {
-            'ignore_http_methods': [],
-            'request_timeout': 240,
-            'disable_encoding':True,
-        }
         options = FirefoxOptions()
         
         if stateful and browser_profile_path:
@@ -59,7 +72,7 @@ def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path
             options.add_argument("--headless") 
             
         executable = get_driver_path("geckodriver")
-        logging.info(f"Using Geckodriver driver at path: {executable}")
+        logging.debug(f"Using Geckodriver driver at path: {executable}")
         if "linux" in current_os:
             options.binary_location = "/usr/bin/firefox"
         
@@ -74,11 +87,6 @@ def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path
          
     elif browser == "chrome":
         global created_stateful_profile_path
-        seleniumwire_options = {
-            'ignore_http_methods': [],
-            'request_timeout': 240,
-            'disable_encoding':True,
-        }
         options = ChromeOptions()
         options.add_argument("--no-sandbox")     # Required when running as root
         options.add_argument("--disable-gpu")
@@ -87,7 +95,7 @@ def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path
         
         # This if works on linux, does not work on windows if chrome already in use
         if not stateful and browser_profile_path: # Stateless with Browser Profile Path given
-            profile_dir = os.path.join(browser_profile_path, "profile_directory") # This makes new profile under each new video
+            profile_dir = stateless_profile_dir(browser_profile_path) # This makes new profile under each new video
             os.makedirs(profile_dir, exist_ok=True)
             options.add_argument(f"--user-data-dir={profile_dir}")
         elif stateful and browser_profile_path:
@@ -106,7 +114,7 @@ def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path
             options.add_argument("--headless=new")
             
         executable = get_driver_path("chromedriver")
-        logging.info(f"Using Chrome driver at path: {executable}")
+        logging.debug(f"Using Chrome driver at path: {executable}")
         
         # if "linux" in current_os:
         #     options.binary_location = "/usr/bin/google-chrome"
@@ -121,13 +129,6 @@ def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path
             raise
         
     elif browser == 'edge':
-        seleniumwire_options = {
-            'ignore_http_methods': [],
-            "request_timeout": 240,
-            'disable_encoding':True,
-            "http2": False,  # Force HTTP/1.1
-            # "connection_timeout": 30,  # Increase connection timeout
-        }
         options = EdgeOptions()
         # options.add_argument("--no-sandbox")
         options.add_argument("--disable-gpu")
@@ -140,7 +141,7 @@ def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path
         options.add_argument("--disable-quic")   # Disable alternative protocol
         
         executable = get_driver_path("msedgedriver")
-        logging.info(f"Using Edge driver at path: {executable}")
+        logging.debug(f"Using Edge driver at path: {executable}")
         
         if headless:
             options.add_argument("--headless=new")
@@ -157,11 +158,6 @@ def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path
             logging.error(f"Error initializing Edge WebDriver: {e}")
         
     elif browser == 'brave':
-        seleniumwire_options = {
-            'ignore_http_methods': [],
-            'request_timeout': 240,
-            'disable_encoding':True,
-        }
         options = ChromeOptions()
         # options.add_argument("--no-sandbox") # When running as root
         options.add_argument("--disable-gpu")
@@ -172,7 +168,7 @@ def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path
             options.add_argument("--headless=new")
         
         executable = get_driver_path("chromedriver")
-        logging.info(f"Brave Using Chrome driver at path: {executable}")
+        logging.debug(f"Brave Using Chrome driver at path: {executable}")
         if "linux" in current_os:
             options.binary_location = "/usr/bin/brave-browser"
         elif "windows" in current_os:
@@ -189,100 +185,94 @@ def setup_webdriver(browser, headless=True, stateful=False, browser_profile_path
     else:
         raise ValueError(f"Unsupported browser: {browser}")
     
+    if driver is not None:
+        capture_policy.apply(driver)
     return driver
 
 
 
-def close_browser_chrome_n_brave(driver, browser):
+def get_driver_pid(driver):
     """
-    Closes the Chrome or Brave browser and aggressively kills any orphaned subprocesses
-    spawned by this script session.
+    PID of the driver service (geckodriver/chromedriver/msedgedriver), the root of the
+    process tree of this browser session.
     """
-
     try:
-        driver.quit()
-        logging.info("WebDriver closed successfully.")
-    except Exception as e:
-        logging.warning(f"Error while quitting WebDriver: {e}")
+        return driver.service.process.pid
+    except AttributeError:
+        return None
+
 
-    keywords = {
-        "chrome": ["chrome", "chromedriver"],
-        "brave": ["brave", "chromedriver"]
-    }
+def get_process_tree(pid):
+    """
+    The process with the given PID and all of its descendants.
+    """
+    if pid is None:
+        return []
+    try:
+        root = psutil.Process(pid)
+        return [root] + root.children(recursive=True)
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return []
 
-    current_uid = os.getuid()
-    session_keywords = keywords[browser]
 
-    def is_target_process(proc):
+def kill_process_tree(processes, timeout=5):
+    """
+    Terminate the given processes, kill whatever is still alive after timeout seconds.
+    """
+    for proc in processes:
         try:
-            # Match name/cmdline and ensure it's run by the current user
-            name = proc.name().lower()
-            cmd = " ".join(proc.cmdline()).lower()
-            return any(k in name or k in cmd for k in session_keywords) and proc.uids().real == current_uid
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            return False
+            proc.terminate()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+    for proc in alive:
+        try:
+            proc.kill()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    if alive:
+        psutil.wait_procs(alive, timeout=timeout)
+    return len(alive)
+
+
+def close_browser_chrome_n_brave(driver, browser):
+    """
+    Closes the Chrome or Brave browser. Kept for compatibility, close_browser now
+    cleans up the process tree of any browser.
+    """
+    close_browser(driver, browser)
+
+
+def close_browser(driver, browser, timeout=10):
+    """
+    Quit the WebDriver and kill what is left of this session's process tree
+    (driver service, browser and its child processes).
+    Only processes of this session are touched, so several crawlers can share a host,
+    and teardown is bounded by timeout regardless of how many processes run on the host.
+    """
+    # Snapshot the tree first: after quit() orphaned browser processes are no longer
+    # descendants of the driver service
+    processes = get_process_tree(get_driver_pid(driver))
+
+    # quit() can hang on a crashed browser, do not wait for it forever
+    quit_thread = threading.Thread(target=quit_driver, args=(driver,), daemon=True)
+    quit_thread.start()
+    quit_thread.join(timeout)
+    if quit_thread.is_alive():
+        logging.warning(f"WebDriver quit did not finish within {timeout} seconds.")
 
     try:
-        for proc in psutil.process_iter(["pid", "name", "cmdline", "uids"]):
-            if is_target_process(proc):
-                logging.info(f"Killing {browser}-related root process: PID {proc.pid} CMD: {' '.join(proc.cmdline())}")
-                try:
-                    for child in proc.children(recursive=True):
-                        try:
-                            logging.info(f"  └─ Killing child process: PID {child.pid} CMD: {' '.join(child.cmdline())}")
-                            child.kill()
-                        except Exception as ce:
-                            logging.warning(f"Failed to kill child process {child.pid}: {ce}")
-                    proc.kill()
-                except Exception as e:
-                    logging.warning(f"Failed to kill process {proc.pid}: {e}")
-        logging.info(f"All {browser} processes terminated for current session.")
+        lingering = [proc for proc in processes if proc.is_running()]
+        if lingering:
+            killed = kill_process_tree(lingering, timeout=timeout / 2)
+            logging.debug(f"Cleaned up {len(lingering)} lingering {browser} processes ({killed} force killed).")
     except Exception as e:
-        logging.warning(f"Brave/Chrome process cleanup failed: {e}")
-        
-        
+        logging.warning(f"Failed to kill browser processes: {e}")
 
-def close_browser(driver, browser):
-    global current_os
-    
-    # if browser in ["chrome", "brave"]:
-    #    close_browser_chrome_n_brave(driver, browser)
-    
-    
+
+def quit_driver(driver):
     try:
         driver.quit()
-        logging.info("WebDriver closed successfully.")
+        logging.debug("WebDriver closed successfully.")
     except Exception as e:
         logging.warning(f"Error while quitting WebDriver: {e}")
-    
-    # TODO: this works for firefox and edge perfectly
-    # Kill browser-specific lingering processes
-    try:
-        if current_os == "linux":
-            if browser == "firefox":
-                subprocess.run(["pkill", "-f", "firefox-esr"], check=False)
-                subprocess.run(["pkill", "-f", "geckodriver"], check=False)
-            # elif browser == "brave":
-                # subprocess.run(["pkill", "-f", "brave"], check=False)
-                #subprocess.run(["pkill", "-f", "chromedriver"], check=False)
-            # elif browser in ["chrome", "duckduckgo"]:
-            #     subprocess.run(["pkill", "-f", "chrome"], check=False)
-            #     subprocess.run(["pkill", "-f", "chromedriver"], check=False)
-            elif browser == "edge":
-                subprocess.run(["pkill", "-f", "microsoft-edge"], check=False)
-                subprocess.run(["pkill", "-f", "msedgedriver"], check=False)
-        elif current_os == "windows":
-            # Fallback to psutil for Windows
-            browser_name_map = {
-                "firefox": ["firefox.exe", "geckodriver.exe"],
-                "chrome": ["chrome.exe", "chromedriver.exe"],
-                "brave": ["brave.exe", "chromedriver.exe"],
-                "edge": ["msedge.exe", "msedgedriver.exe"]
-            }
-            for proc in psutil.process_iter(["pid", "name"]):
-                for bname in browser_name_map.get(browser, []):
-                    if bname.lower() in proc.info["name"].lower():
-                        proc.kill()
-        logging.info(f"Cleaned up lingering browser processes for: {browser}")
-    except Exception as e:
-        logging.warning(f"Failed to kill browser processes: {e}")
\ No newline at end of file
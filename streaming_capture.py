@@ -0,0 +1,137 @@
+import json
+import logging
+import tempfile
+import threading
+from urllib.parse import urlparse
+
+from utils import extract_request_data
+
+
+# selenium-wire keeps only the most recent requests in memory while streaming,
+# everything else has already been exported through the interceptors
+STREAMING_SELENIUMWIRE_OPTIONS = {
+    'request_storage': 'memory',
+    'request_storage_max_size': 100,
+}
+
+# Bytes of a visit's records kept in memory before they spill to a temporary file
+SPILL_MEMORY_BYTES = 1024 * 1024
+
+# Fields of the records returned for a visit, enough to find its landing page
+SUMMARY_FIELDS = ("url", "status_code", "location_header", "response_headers")
+
+
+def spill_record(spill, summaries, record):
+    spill.write(json.dumps(record) + "\n")
+    summaries.append({field: record.get(field) for field in SUMMARY_FIELDS})
+
+
+class StreamingCapture:
+    """
+    Builds request records as responses arrive, using selenium-wire's request/response
+    interceptors, instead of pulling driver.requests at the end of a visit, so selenium-wire
+    only has to keep its most recent requests. The records of a visit go to a spill file as
+    they arrive (in memory up to SPILL_MEMORY_BYTES) and are copied to the sink only if the
+    visit succeeded, so a failed attempt leaves no output behind and a retried website appears
+    once, while memory stays flat on chatty websites. The interceptors run on selenium-wire's
+    proxy threads, so all state is locked.
+    """
+
+    def __init__(self, sink, blob_store=None, capture_policy=None):
+        self.sink = sink
+        self.blob_store = blob_store
+        self.capture_policy = capture_policy
+        self.lock = threading.Lock()
+        self.site = None
+        self.pending = {}
+        self.spill = None
+        self.summaries = []
+        self.origins = set()
+        self.requests_seen = 0
+        self.responses_seen = 0
+
+    def attach(self, driver):
+        """
+        Install the interceptors on a (newly launched) driver.
+        """
+        driver.request_interceptor = self.on_request
+        driver.response_interceptor = self.on_response
+
+    def start_site(self, timestamp, website_id, website_url):
+        with self.lock:
+            self.site = (timestamp, website_id, website_url)
+            self.pending = {}
+            self.spill = tempfile.SpooledTemporaryFile(max_size=SPILL_MEMORY_BYTES, mode='w+', encoding='utf-8')
+            self.summaries = []
+            self.origins = set()
+            self.requests_seen = 0
+            self.responses_seen = 0
+
+    def on_request(self, request):
+        with self.lock:
+            if self.site is None:
+                return
+            self.pending[request.id] = request
+            self.origins.add(f"{urlparse(request.url).scheme}://{urlparse(request.url).netloc}")
+            self.requests_seen += 1
+
+    def on_response(self, request, response):
+        site = self.site
+        if site is None:
+            return
+        try:
+            request.response = response
+            record = extract_request_data(request, blob_store=self.blob_store, capture_policy=self.capture_policy)
+        except Exception as e:
+            logging.error(f"Error processing request {request.url if request.url else 'unknown url'}: {e}")
+            return
+        with self.lock:
+            # Responses arriving after the visit ended belong to no website
+            if self.site is not site:
+                return
+            self.pending.pop(request.id, None)
+            self.responses_seen += 1
+            spill_record(self.spill, self.summaries, record)
+
+    def activity_state(self):
+        """
+        (requests seen, requests still in flight), used to detect when the page settled.
+        """
+        with self.lock:
+            return self.requests_seen, self.requests_seen - self.responses_seen
+
+    def finish_site(self, driver=None, succeeded=True):
+        """
+        End the current visit. A successful visit is written to the sink together with the
+        requests that never got a response, a failed one is discarded. Drops whatever
+        selenium-wire still holds for this website.
+        Returns the url, status and headers (SUMMARY_FIELDS) of the requests written for the website.
+        """
+        with self.lock:
+            site, self.site = self.site, None
+            if site is None:
+                return []
+            pending = list(self.pending.values()) if succeeded else []
+            spill, self.spill = self.spill, None
+            summaries = self.summaries if succeeded else []
+            self.pending = {}
+            self.summaries = []
+
+        # No interceptor writes to the spill file anymore, the visit has ended
+        with spill:
+            if succeeded:
+                for request in pending:
+                    try:
+                        spill_record(spill, summaries, extract_request_data(request, blob_store=self.blob_store, capture_policy=self.capture_policy))
+                    except Exception as e:
+                        logging.error(f"Error processing request {request.url if request.url else 'unknown url'}: {e}")
+                spill.seek(0)
+                self.sink.write_site(*site, (json.loads(line) for line in spill))
+
+        if driver is not None:
+            try:
+                del driver.requests
+            except Exception as e:
+                logging.warning(f"Failed to clear captured requests: {e}")
+        logging.info(f"Length of web requests: {len(summaries)}")
+        return summaries
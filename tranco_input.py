@@ -0,0 +1,105 @@
+import heapq
+import hashlib
+import logging
+import argparse
+
+
+def parse_shard(value):
+    """
+    argparse type for --shard: "k/n" selects the k-th of n shards (1-based).
+    """
+    try:
+        k, n = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{value}', expected k/n (e.g. 2/8)")
+    if n < 1 or not 1 <= k <= n:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{value}', k must be between 1 and n")
+    return k, n
+
+
+def sample_key(rank, seed):
+    """
+    Deterministic pseudo-random key of a rank, identical on every host for the same seed.
+    """
+    return hashlib.blake2b(f"{seed}:{rank}".encode(), digest_size=8).digest()
+
+
+def read_tranco_csv(csv_path):
+    """
+    Stream (rank, domain) tuples from a Tranco style "rank,domain" CSV file.
+    """
+    with open(csv_path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                key, value = line.split(",", 1)
+                yield int(key), value.strip()
+            except ValueError:
+                logging.warning(f"Skipping malformed line {line_number} in {csv_path}: {line}")
+
+
+def sample_by_bucket(sites, bucket_size, per_bucket, seed=0):
+    """
+    Stratified sampling: keep per_bucket websites out of every bucket_size consecutive ranks.
+    The choice only depends on rank and seed, so every host samples the same websites.
+    Expects the input ordered by rank; memory stays bounded by per_bucket.
+    """
+    current_bucket = None
+    heap = []
+
+    def flush():
+        for _, rank, domain in sorted(heap, key=lambda item: item[1]):
+            yield rank, domain
+
+    for rank, domain in sites:
+        bucket = (rank - 1) // bucket_size
+        if bucket != current_bucket:
+            yield from flush()
+            current_bucket = bucket
+            heap = []
+        # Max-heap on the sample key (negated) keeps the per_bucket smallest keys
+        item = (tuple(-b for b in sample_key(rank, seed)), rank, domain)
+        if len(heap) < per_bucket:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+    yield from flush()
+
+
+def iter_tranco_sites(csv_path, start_rank=None, end_rank=None, shard=None, bucket_size=None, per_bucket=None, seed=0):
+    """
+    Stream (rank, domain) websites to crawl from the Tranco list.
+
+    start_rank/end_rank: inclusive rank range. The list is rank-ordered, so reading stops after end_rank.
+    shard: (k, n) keeps websites with rank % n == k - 1, so n hosts split one list without pre-splitting files.
+    bucket_size/per_bucket: stratified sample of per_bucket websites out of every bucket_size ranks.
+    """
+    def in_range(sites):
+        for rank, domain in sites:
+            if start_rank is not None and rank < start_rank:
+                continue
+            if end_rank is not None and rank > end_rank:
+                break
+            yield rank, domain
+
+    sites = in_range(read_tranco_csv(csv_path))
+    if bucket_size and per_bucket:
+        sites = sample_by_bucket(sites, bucket_size, per_bucket, seed=seed)
+    if shard:
+        k, n = shard
+        sites = ((rank, domain) for rank, domain in sites if rank % n == k - 1)
+    return sites
+
+
+def describe_selection(csv_path, start_rank=None, end_rank=None, shard=None, bucket_size=None, per_bucket=None, seed=0):
+    """
+    Human readable description of the input selection for the summary.
+    """
+    description = f"{csv_path}, ranks {start_rank or 1}-{end_rank or 'end'}"
+    if bucket_size and per_bucket:
+        description += f", {per_bucket} per {bucket_size} ranks (seed {seed})"
+    if shard:
+        description += f", shard {shard[0]}/{shard[1]}"
+    return description
@@ -3,36 +3,28 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 
 from datetime import datetime
-import re
+import time
+import threading
 from urllib.parse import urlparse, parse_qs
 import logging
 from requests.exceptions import ReadTimeout
 
+from id_extraction import id_patterns, IdExtractor
 
-
-# Define ID patterns for detection
-id_patterns = {
-    'gclid': r'[?&](gclid)=([a-zA-Z0-9_-]+)',
-    'fbclid': r'[?&](fbclid)=([a-zA-Z0-9_-]+)',
-    'msclkid': r'[?&](msclkid)=([a-zA-Z0-9_-]+)',
-    'user_id': r'[?&](uid|user_id|userid|user)=([a-zA-Z0-9_-]+)',
-    'tracking_id': r'[?&](tracking_id|id|token|tracking|trk|track|trk_id)=([a-zA-Z0-9_-]+)',
-    'cid': r'[?&](cid)=([a-zA-Z0-9_-]+)',
-    'uid': r'[?&](uid)=([a-zA-Z0-9_-]+)',
-    'id' : r"[?&]([\w-]*id[\w-]*)=([\w.-]+)",
-}
+# Shared single-pass extractor, built once from id_patterns
+id_extractor = IdExtractor(id_patterns)
 
 def current_time():
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 def take_page_screenshot(driver, filename):
     driver.save_screenshot(filename)
-    logging.info(f"Full page screenshot saved to {filename}\n")
+    logging.debug(f"Full page screenshot saved to {filename}\n")
 
 
 def take_element_screenshot(driver, element, filename):
     element.screenshot(filename)
-    logging.info(f"Element screenshot saved to {filename}\n")
+    logging.debug(f"Element screenshot saved to {filename}\n")
 
 
 def extract_domain(url):
@@ -45,45 +37,117 @@ def extract_domain(url):
         return None
 
 # Function to extract all matching IDs from a URL based on the provided patterns
-def extract_ids_from_url(url, id_patterns):
-    ids_found = {}
-    for id_name, pattern in id_patterns.items():
-        matches = re.findall(pattern, url)
-        if matches:
-            ids_found[id_name] = [match[1] for match in matches]  # Capture the ID values
-    return ids_found
+def extract_ids_from_url(url, id_patterns=id_patterns):
+    extractor = id_extractor if id_patterns is id_extractor.source_patterns else IdExtractor(id_patterns)
+    return extractor.extract(url)
 
 
 def wait_for_page_load(driver, timeout=10):
     """
     Wait until the page is fully loaded.
     """
-    logging.info("Waiting for page to load...")
+    logging.debug("Waiting for page to load...")
     try:
         WebDriverWait(driver, timeout).until(
             lambda d: d.execute_script('return document.readyState') == 'complete'
         )
-        logging.info(f"Page is fully loaded in.")
+        logging.debug(f"Page is fully loaded in.")
     except Exception as e:
         logging.error(f"Error: Page load timeout after {timeout} seconds. {e}")
 
 
-def extract_websocket_messages(ws_messages):
-    """Extract details from WebSocket messages."""
-    ws_data = []
-    for msg in ws_messages:
-        ws_data.append({
-            'timestamp': msg.date.isoformat() if msg.date else datetime.now().isoformat(),
-            'content': msg.content.decode('utf-8', errors='ignore') if isinstance(msg.content, bytes) else msg.content,
-            'from_client': msg.from_client  # True if sent by client, False if from server
-        })
-    return ws_data
+class NetworkActivity:
+    """
+    Counts the requests and responses of a batch-mode browser in selenium-wire's interceptors,
+    so waiting for the network to settle does not load driver.requests on every poll.
+    """
 
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests_seen = 0
+        self.responses_seen = 0
 
-def extract_request_data(req):
-    
-    return {
+    def attach(self, driver):
+        driver.request_interceptor = self.on_request
+        driver.response_interceptor = self.on_response
+
+    def on_request(self, request):
+        with self.lock:
+            self.requests_seen += 1
+
+    def on_response(self, request, response):
+        with self.lock:
+            self.responses_seen += 1
+
+    def activity_state(self):
+        """
+        (requests seen, requests still in flight), used to detect when the page settled.
+        """
+        with self.lock:
+            return self.requests_seen, self.requests_seen - self.responses_seen
+
+
+def wait_for_network_idle(driver, idle_window=5, min_wait=2, max_wait=30, poll_interval=0.5, activity=None):
+    """
+    Wait until the captured traffic settles, i.e. no new requests were issued and no
+    responses arrived for idle_window seconds. Requests that stay in flight without
+    progress (long-polling, streaming) do not keep the page busy.
+    Always waits at least min_wait and at most max_wait seconds. Returns the seconds waited.
+    activity() may replace polling driver.requests, it returns (requests seen, requests in flight).
+    """
+    logging.debug("Waiting for network to settle...")
+    start = time.monotonic()
+    last_state = None
+    last_change = start
+    while True:
+        now = time.monotonic()
+        elapsed = now - start
+        try:
+            if activity is not None:
+                state = activity()
+            else:
+                requests = driver.requests
+                # (captured requests, requests still waiting for a response)
+                state = (len(requests), sum(1 for req in requests if req.response is None))
+        except Exception as e:
+            logging.warning(f"Could not poll captured requests: {e}")
+            state = last_state
+
+        if state != last_state:
+            last_state = state
+            last_change = now
+
+        if elapsed >= max_wait:
+            logging.info(f"Network did not settle within {max_wait} seconds ({last_state[0] if last_state else 0} requests captured).")
+            return elapsed
+        if elapsed >= min_wait and now - last_change >= idle_window:
+            logging.info(f"Network settled after {elapsed:.1f} seconds ({last_state[0] if last_state else 0} requests captured).")
+            return elapsed
+        time.sleep(poll_interval)
+
+
+def extract_request_data(req, blob_store=None, capture_policy=None):
+    """
+    Build the record of one captured request. With a blob_store the response body is
+    written to the store and the record only carries its digest and size.
+    Bodies the capture_policy excludes are left out and their skip reason recorded, also when
+    the policy already dropped them before selenium-wire stored the response.
+    Timing: timestamp is when the proxy received the request, response_timestamp when the
+    complete response arrived there; duration_ms is the time in between.
+    """
+    body = req.response.body if req.response else None
+    response_date = req.response.date if req.response else None
+    content_type = req.response.headers.get('Content-Type') if req.response else None
+    body_size = len(body) if body is not None else None
+    skipped = getattr(req.response, 'body_skipped', None) if req.response else None
+    if skipped is not None:
+        skip_reason, body_size = skipped
+    else:
+        skip_reason = capture_policy.body_skip_reason(body, content_type) if capture_policy is not None and body else None
+    data = {
         'timestamp': req.date.isoformat() if req.date else datetime.now().isoformat(),
+        'response_timestamp': response_date.isoformat() if response_date else None,
+        'duration_ms': round((response_date - req.date).total_seconds() * 1000, 1) if response_date and req.date else None,
         'url': req.url,
         'method': req.method,
         'status_code': req.response.status_code if req.response else None,
@@ -93,13 +157,20 @@ def extract_request_data(req):
         # 'is_redirect': req.response and req.response.status_code in (301, 302, 303, 307, 308),
         # 'extracted_ids': extract_ids_from_url(req.url, id_patterns),
         # 'query_params': parse_qs(urlparse(req.url).query),
-        'response_body': req.response.body.decode('utf-8', errors='ignore') if req.response and req.response.body else None,
-        # 'websocket_messages': extract_websocket_messages(req.ws_messages) if req.ws_messages else None,
+        'response_body': body.decode('utf-8', errors='ignore') if body and blob_store is None and skip_reason is None else None,
+        # WebSocket messages are written to their own stream by websocket_capture.WebSocketCapture
+        'request_body_size': len(req.body) if req.body else 0,
+        'response_body_size': body_size,
     }
+    if skip_reason is not None:
+        data.update({'response_body_sha256': None, 'response_body_size': body_size, 'response_body_skipped': skip_reason})
+    elif blob_store is not None:
+        data.update(blob_store.store_body(body))
+    return data
 
 
-def capture_browser_data(driver):
-    logging.info("Capturing web requests...")
+def capture_browser_data(driver, blob_store=None, capture_policy=None):
+    logging.debug("Capturing web requests...")
     # Cookies
     # cookies = driver.get_cookies()
     # js_cookies = driver.execute_script("return document.cookie")
@@ -116,12 +187,12 @@ def capture_browser_data(driver):
     web_requests = []
     for req in requests:
         try:
-            data = extract_request_data(req)
+            data = extract_request_data(req, blob_store=blob_store, capture_policy=capture_policy)
             web_requests.append(data)
         except ReadTimeout:
             logging.warning(f"Request timed out for {req.url if req.url else 'unknown url'}. Retrying extraction...")
             try:
-                data = extract_request_data(req)
+                data = extract_request_data(req, blob_store=blob_store, capture_policy=capture_policy)
                 web_requests.append(data)
             except Exception as e:
                 logging.error(f"Failed extraction on retry for {req.url if req.url else 'unknown url'}: {e}")
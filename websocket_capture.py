@@ -0,0 +1,150 @@
+import os
+import random
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from output_sinks import JsonlSink, repair_gzip
+
+
+WEBSOCKET_FILENAME = "websocket_messages.jsonl.gz"
+
+
+def websocket_path(base_path, partition=None):
+    """
+    Path of the run's WebSocket stream, or of one worker partition of it.
+    """
+    if partition is None:
+        return os.path.join(base_path, WEBSOCKET_FILENAME)
+    name, extension = WEBSOCKET_FILENAME.split(".", 1)
+    return os.path.join(base_path, f"{name}_worker_{partition}.{extension}")
+
+
+def merge_websocket_partitions(base_path, partitions):
+    """
+    Append the worker partitions to the run's WebSocket stream; gzip members concatenate as they are.
+    """
+    with open(websocket_path(base_path), 'ab') as out:
+        for partition in partitions:
+            path = websocket_path(base_path, partition)
+            if not os.path.exists(path):
+                continue
+            repair_gzip(path)
+            with open(path, 'rb') as part:
+                shutil.copyfileobj(part, out)
+            os.remove(path)
+
+
+def handshake_url(storage, request_id):
+    """
+    URL of a WebSocket connection, from the handshake request selenium-wire stored.
+    """
+    try:
+        return storage.load_request(request_id).url
+    except Exception:
+        return None
+
+
+class WebSocketCapture:
+    """
+    Writes the WebSocket traffic of every visited website to its own stream
+    (websocket_messages.jsonl.gz), separate from the request records. Per connection, one
+    "connection" record with the totals and one "message" record per kept message.
+    Messages are sampled (sample_rate, reproducible per connection and seed) and kept until
+    max_messages or max_bytes of payload per connection; with hash_payloads only the SHA-256 of a
+    payload is stored. selenium-wire has no interceptor for WebSocket messages, so attach() takes
+    over its storage's save_ws_message: sampling and caps apply as messages arrive, only kept
+    messages are held until the visit ends, and selenium-wire itself stores none.
+    """
+
+    def __init__(self, base_path, partition=None, max_messages=200, max_bytes=256 * 1024, sample_rate=1.0, hash_payloads=False, seed=0,
+                 batch_size=1000):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.sample_rate = sample_rate
+        self.hash_payloads = hash_payloads
+        self.seed = seed
+        self.sink = JsonlSink(websocket_path(base_path, partition), batch_size=batch_size)
+        # The proxy threads deliver messages while the crawl thread starts and ends visits
+        self.lock = threading.Lock()
+        self.site = None
+        self.connections = {}
+
+    def attach(self, driver):
+        """
+        Receive the WebSocket messages of a (newly launched) driver.
+        """
+        storage = getattr(getattr(driver, "backend", None), "storage", None)
+        if storage is None:
+            logging.warning("selenium-wire storage not found, WebSocket messages are not captured.")
+            return
+        storage.save_ws_message = lambda request_id, message: self.on_message(storage, request_id, message)
+
+    def start_site(self, timestamp, website_id, website_url):
+        with self.lock:
+            self.site = (timestamp, website_id, website_url)
+            self.connections = {}
+
+    def on_message(self, storage, request_id, message):
+        with self.lock:
+            if self.site is None:
+                return
+            connection = self.connections.get(request_id)
+            if connection is None:
+                url = handshake_url(storage, request_id)
+                connection = self.connections[request_id] = {
+                    "url": url, "sampler": random.Random(f"{self.seed}:{self.site[1]}:{url}"), "messages": 0, "bytes": 0,
+                    "kept": [], "kept_bytes": 0, "dropped_by_cap": 0, "dropped_by_sampling": 0,
+                }
+            self.add_message(connection, message)
+
+    def add_message(self, connection, message):
+        content = message.content
+        payload = content.encode('utf-8') if isinstance(content, str) else content or b""
+        index = connection["messages"]
+        connection["messages"] += 1
+        connection["bytes"] += len(payload)
+        if self.sample_rate < 1 and connection["sampler"].random() >= self.sample_rate:
+            connection["dropped_by_sampling"] += 1
+            return
+        if len(connection["kept"]) >= self.max_messages or connection["kept_bytes"] + len(payload) > self.max_bytes:
+            connection["dropped_by_cap"] += 1
+            return
+        connection["kept_bytes"] += len(payload)
+        record = dict(record="message", index=index, from_client=message.from_client, size=len(payload),
+                      binary=not isinstance(content, str),
+                      timestamp=message.date.isoformat() if message.date else datetime.now().isoformat())
+        if self.hash_payloads:
+            record["content_sha256"] = hashlib.sha256(payload).hexdigest()
+        else:
+            record["content"] = content if isinstance(content, str) else payload.decode('utf-8', errors='ignore')
+        connection["kept"].append(record)
+
+    def finish_site(self, succeeded=True):
+        """
+        End the current visit and write its connections, unless the visit failed.
+        Returns the number of messages written.
+        """
+        with self.lock:
+            site, self.site = self.site, None
+            connections, self.connections = self.connections, {}
+        if site is None or not succeeded:
+            return 0
+        timestamp, website_id, website_url = site
+        written = 0
+        for number, connection in enumerate(connections.values()):
+            fields = {"visit_timestamp": timestamp, "website_id": website_id, "website_url": website_url, "connection": number}
+            if connection["dropped_by_cap"]:
+                logging.debug(f"WebSocket {connection['url']}: {connection['dropped_by_cap']} of {connection['messages']} messages over the per-connection caps")
+            self.sink.write_records([dict(fields, record="connection", url=connection["url"], messages=connection["messages"],
+                                          bytes=connection["bytes"], kept=len(connection["kept"]), dropped_by_cap=connection["dropped_by_cap"],
+                                          dropped_by_sampling=connection["dropped_by_sampling"])])
+            self.sink.write_records(dict(fields, **record) for record in connection["kept"])
+            written += len(connection["kept"])
+        self.sink.flush()
+        return written
+
+    def close(self):
+        self.sink.close()